@@ -134,12 +134,76 @@ CACHES = {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
             'SOCKET_CONNECT_TIMEOUT': 5,
             'SOCKET_TIMEOUT': 5,
+            'COMPRESSOR': 'sns.compressors.MeteredZlibCompressor',
+            # Bytes above which values are zlib compressed
+            'COMPRESS_MIN_LENGTH': int(
+                os.environ.get('CACHE_COMPRESS_MIN_LENGTH', 1024)
+            ),
         }
     }
 }
 
 API_CACHE_TTL = 60 * 10
 
+# Seconds provider activity is served as fresh ('soft') and at all ('hard').
+# Stale entries are served while refreshed in the background.
+ACTIVITY_CACHE_TTL = {
+    'default': {'soft': API_CACHE_TTL, 'hard': 60 * 60},
+    # Meetup crawls up to 20 pages per fetch
+    'meetup': {'soft': 60 * 30, 'hard': 60 * 60 * 3},
+}
+
+# Activity fetching
+
+# Max threads per worker process fetching provider activity
+ACTIVITY_FETCH_WORKERS = int(os.environ.get('ACTIVITY_FETCH_WORKERS', 8))
+# Max threads per worker process refreshing cached activity in the background
+ACTIVITY_BACKGROUND_WORKERS = int(os.environ.get('ACTIVITY_BACKGROUND_WORKERS', 4))
+# Max background refreshes queued or running per worker process; more are dropped
+ACTIVITY_BACKGROUND_BACKLOG = int(os.environ.get('ACTIVITY_BACKGROUND_BACKLOG', 50))
+# Seconds to wait on providers before rendering them as still loading
+ACTIVITY_FETCH_DEADLINE = float(os.environ.get('ACTIVITY_FETCH_DEADLINE', 8))
+# Seconds a process may hold the lock to fill a provider's cache entry
+ACTIVITY_LOCK_TIMEOUT = 30
+# Seconds all upstream calls of one fetch may take, within the lock timeout
+ACTIVITY_UPSTREAM_DEADLINE = float(os.environ.get('ACTIVITY_UPSTREAM_DEADLINE', 25))
+# Seconds other processes wait on that fill before using the last value
+ACTIVITY_LOCK_WAIT = 5
+# Seconds to keep the last value of each entry as a fallback
+ACTIVITY_LAST_TTL = 60 * 60 * 24
+# Max stored items of an account read back when its entry is not cached
+ACTIVITY_STORED_ITEMS = 20
+# Seconds failed fetches are cached, by kind, before fetching again.
+# Permanent failures (e.g. no such account) are also cleared by editing the profile.
+ACTIVITY_FAILURE_TTL = {'transient': 30, 'permanent': 60 * 60 * 24 * 7}
+
+# Per-process cache of hot activity entries in front of Redis
+
+# Seconds entries are kept
+ACTIVITY_LOCAL_TTL = int(os.environ.get('ACTIVITY_LOCAL_TTL', 30))
+ACTIVITY_LOCAL_MAX_ENTRIES = int(os.environ.get('ACTIVITY_LOCAL_MAX_ENTRIES', 1000))
+ACTIVITY_LOCAL_MAX_BYTES = int(
+    os.environ.get('ACTIVITY_LOCAL_MAX_BYTES', 8 * 1024 * 1024)
+)
+
+# Background refreshes (`manage.py refresh_scheduler`)
+
+# Seconds per window profile views are counted in. Views of the current and
+# previous window make up a profile's recent views.
+ACTIVITY_VIEW_WINDOW = 60 * 60
+# Recent views below which a profile's activity isn't kept warm
+ACTIVITY_REFRESH_MIN_VIEWS = 1
+# Seconds before an entry goes stale that it's refreshed
+ACTIVITY_REFRESH_LEAD = 60
+# Seconds earlier an entry is refreshed per recent view of its profile
+ACTIVITY_REFRESH_VIEW_WEIGHT = 10
+# Max concurrent refreshes of each provider. Meetup is left out; it can only
+# be fetched with a visitor's OAuth token.
+ACTIVITY_REFRESH_CONCURRENCY = {'reddit': 2, 'spotify': 2, 'twitter': 1}
+# Seconds a refresh asked for by a visitor (`manage.py refresh_worker`) is
+# considered pending; further requests in that time are dropped
+ACTIVITY_REFRESH_JOB_TIMEOUT = 60 * 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
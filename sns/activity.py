@@ -0,0 +1,615 @@
+"""Fetch and cache provider activity for the `activity_card` view."""
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Q
+import pytz
+
+from . import local_cache, metrics
+from .api import records
+from .api.transport import Deadline
+from .api.utils import GetActivity, meetup_token_expired, refresh_meetup_token
+from .models import ActivityItem, Profile
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for a value being filled by another process
+LOCK_POLL_INTERVAL = 0.1
+
+# Hits and misses of the local and shared cache tiers
+tier_metrics = metrics.Buffer('activity:')
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_refresh_executor = None
+_refresh_executor_pid = None
+
+
+class SessionRequest:
+    """Stand-in request holding a private copy of a session.
+
+    `GetActivity` methods read and write OAuth tokens on `request.session`.
+    Each worker thread gets its own copy so providers never share a session
+    object; changes are merged back by `merge_session` afterwards.
+
+    """
+
+    def __init__(self, session=None):
+        self.session = dict(session or {})
+
+
+def get_executor():
+    """Return the process-wide pool used for provider fetches."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        # Gunicorn forks workers; threads don't survive a fork.
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ACTIVITY_FETCH_WORKERS,
+                thread_name_prefix='activity',
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+class BoundedExecutor:
+    """Thread pool dropping tasks beyond `backlog` queued or running ones."""
+
+    def __init__(self, max_workers, backlog, thread_name_prefix=''):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=thread_name_prefix
+        )
+        self._slots = threading.BoundedSemaphore(backlog)
+
+    def submit(self, fn, *args, **kwargs):
+        """Return future of `fn(*args, **kwargs)`, or None if dropped."""
+        if not self._slots.acquire(blocking=False):
+            metrics.incr('activity:refreshes_dropped')
+            return None
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+def get_refresh_executor():
+    """Return the process-wide pool for background refreshes.
+
+    Kept apart from `get_executor`'s pool so slow refreshes never delay
+    fetches a visitor is waiting on.
+
+    """
+    global _refresh_executor, _refresh_executor_pid
+    with _executor_lock:
+        if _refresh_executor is None or _refresh_executor_pid != os.getpid():
+            _refresh_executor = BoundedExecutor(
+                settings.ACTIVITY_BACKGROUND_WORKERS,
+                settings.ACTIVITY_BACKGROUND_BACKLOG,
+                thread_name_prefix='activity-refresh',
+            )
+            _refresh_executor_pid = os.getpid()
+        return _refresh_executor
+
+
+def activity_key(sns, acct):
+    """Return cache key of `acct`'s activity, shared by all profiles listing it."""
+    return 'activity:%s:%s' % (sns, acct)
+
+
+def activity_keys(profile, only=None):
+    """Return {cache key: (sns, acct)} for each account set on `profile`, or
+    only its account on provider `only`."""
+    return {
+        activity_key(sns, acct): (sns, acct)
+        for sns, acct in profile.get_fields()
+        if acct and only in (None, sns)
+    }
+
+
+def get_cached(profile, only=None):
+    """Return cached activity by key of `profile`, or only of its account
+    on provider `only`.
+
+    Entries are looked up in this process's local cache first, the rest in
+    the shared cache in one round-trip.
+
+    """
+    keys = activity_keys(profile, only)
+    local = local_cache.get_local()
+    cached = local.get_many(keys)
+    misses = [key for key in keys if key not in cached]
+    tier_metrics.add(local_hits=len(cached), local_misses=len(misses))
+    if not misses:
+        return cached
+
+    shared = cache.get_many(misses)
+    tier_metrics.add(shared_hits=len(shared), shared_misses=len(misses) - len(shared))
+    local.set_many({k: v for k, v in shared.items() if isinstance(v, str)})
+    return {**cached, **shared}
+
+
+def cache_ttl(sns):
+    """Return (soft, hard) expiry in seconds of `sns` activity."""
+    ttl = settings.ACTIVITY_CACHE_TTL
+    ttl = {**ttl['default'], **ttl.get(sns, {})}
+    return ttl['soft'], ttl['hard']
+
+
+def encode_entry(activity, fresh_until):
+    """Return cache entry of `activity` (or `Failure` marker) as compact JSON."""
+    if isinstance(activity, records.Failure):
+        activity = activity._asdict()
+    return records.dumps([activity, fresh_until])
+
+
+def decode_entry(value):
+    """Return (activity, fresh until) of cache entry `value`, or None.
+
+    Guards against values written in an older format, which are refetched.
+
+    """
+    if not isinstance(value, str):
+        return None
+    activity, fresh_until = json.loads(value)
+    return records.to_activity(activity), fresh_until
+
+
+def is_complete(activity):
+    """Return whether `activity` is a fetch that wasn't cut short or paused.
+
+    Only complete activity replaces stored items and the last value.
+
+    """
+    return (
+        isinstance(activity, records.Activity)
+        and not activity.partial
+        and not activity.paused_until
+    )
+
+
+def cache_activity(data):
+    """Write `data` ({key: (sns, activity)}).
+
+    Entries are stored as (activity, fresh until) JSON and kept until their
+    provider's hard expiry. `Failure` markers are kept for the TTL of their
+    kind in `ACTIVITY_FAILURE_TTL` instead. Partial activity is only fresh
+    for as long as a transient failure, paused activity until the pause
+    ends. Only complete activity is copied to the last value. Entries
+    sharing an expiry go out in a single `set_many`.
+
+    """
+    now = time.time()
+    by_ttl = {}
+    written = {}
+    for key, (sns, activity) in data.items():
+        if isinstance(activity, records.Failure):
+            soft = hard = settings.ACTIVITY_FAILURE_TTL[activity.kind]
+        else:
+            soft, hard = cache_ttl(sns)
+            if activity.partial:
+                soft = min(soft, settings.ACTIVITY_FAILURE_TTL[records.TRANSIENT])
+            if activity.paused_until:
+                # Fetch again once the rate limit resets
+                soft = min(soft, max(activity.paused_until - now, 0))
+        written[key] = encode_entry(activity, now + soft)
+        by_ttl.setdefault(hard, {})[key] = written[key]
+    for timeout, entries in by_ttl.items():
+        cache.set_many(entries, timeout)
+    local_cache.get_local().set_many(written)
+    # Fallback for callers that time out waiting on a single-flight fill
+    last = {
+        last_key(k): records.dumps(activity)
+        for k, (_, activity) in data.items()
+        if is_complete(activity)
+    }
+    if last:
+        cache.set_many(last, settings.ACTIVITY_LAST_TTL)
+    # Average entry size is bytes / entries
+    metrics.incr('activity:entries_written', len(data))
+    metrics.incr('activity:bytes_written', sum(map(len, written.values())))
+
+
+def forget_failures(accounts):
+    """Delete `Failure` markers of `accounts` ({key: (sns, acct)}) so they are
+    fetched again."""
+    if not accounts:
+        return
+    entries = {k: decode_entry(v) for k, v in cache.get_many(list(accounts)).items()}
+    failed = [k for k, e in entries.items() if e and isinstance(e[0], records.Failure)]
+    if failed:
+        cache.delete_many(failed)
+        local_cache.invalidate(failed)
+
+
+def serve_failures(data, keys):
+    """Replace `Failure` markers in `data` ({sns: activity}) in place.
+
+    Transient failures are replaced with the last value written to their
+    key in `keys` ({sns: key}); permanent ones with None.
+
+    """
+    transient = {
+        sns: keys[sns]
+        for sns, activity in data.items()
+        if isinstance(activity, records.Failure) and activity.kind == records.TRANSIENT
+    }
+    last = {}
+    if transient:
+        last = cache.get_many([last_key(k) for k in transient.values()])
+    for sns, activity in data.items():
+        if isinstance(activity, records.Failure):
+            data[sns] = (
+                records.loads(last.get(last_key(transient[sns])))
+                if sns in transient
+                else None
+            )
+
+
+def drop_orphans(accounts):
+    """Delete activity of `accounts` ({key: (sns, acct)}) no profile lists.
+
+    Accounts still listed by any profile are kept. Cached entries and stored
+    items of the rest are deleted, and local copies are dropped in every
+    process.
+
+    """
+    accounts = dict(accounts)
+    if not accounts:
+        return
+    listing = Profile.objects.filter(
+        Q(*(Q(**{sns: acct}) for sns, acct in accounts.values()), _connector=Q.OR)
+    )
+    for profile in listing:
+        for key in activity_keys(profile):
+            accounts.pop(key, None)
+    if not accounts:
+        return
+
+    cache.delete_many([*accounts, *map(last_key, accounts)])
+    local_cache.invalidate(accounts)
+    for sns, acct in accounts.values():
+        ActivityItem.objects.filter(provider=sns, account=acct).delete()
+
+
+def prewarm(accounts):
+    """Fetch uncached activity of `accounts` ({key: (sns, acct)}) in the
+    background.
+
+    Only providers refreshed without a visitor's session are fetched.
+
+    """
+    accounts = {
+        key: account
+        for key, account in accounts.items()
+        if account[0] in settings.ACTIVITY_REFRESH_CONCURRENCY
+    }
+    cached = cache.get_many(list(accounts)) if accounts else {}
+    for key, (sns, acct) in accounts.items():
+        if key not in cached:
+            metrics.incr('activity:prewarms')
+            get_refresh_executor().submit(revalidate, {}, key, sns, acct)
+
+
+def store(sns, acct, activity):
+    """Make the statuses of fetched `activity` the stored items of `acct`.
+
+    Failed (None or a `Failure`), partial and paused fetches leave stored
+    items as they are.
+
+    """
+    if not is_complete(activity):
+        return
+    ActivityItem.objects.replace(
+        sns,
+        acct,
+        [
+            ActivityItem(
+                provider=sns,
+                account=acct,
+                external_id=s.id or s.url,
+                title=s.title,
+                text=s.text,
+                url=s.url,
+                img=s.img,
+                context=s.context,
+                created=datetime.fromtimestamp(s.created, pytz.utc)
+                if s.created
+                else None,
+                position=i,
+            )
+            for i, s in enumerate(activity.statuses)
+        ],
+    )
+
+
+def stored_activity(sns, acct):
+    """Return `Activity` of the newest stored items of `acct`, or None if none."""
+    items = ActivityItem.objects.newest(sns, acct, settings.ACTIVITY_STORED_ITEMS)
+    if not items:
+        return None
+    return records.Activity(
+        url=GetActivity.profile_url(sns, acct),
+        statuses=[
+            records.Status(
+                title=i.title,
+                text=i.text,
+                url=i.url,
+                img=i.img,
+                created=records.epoch(i.created),
+                context=i.context,
+                id=i.external_id,
+            )
+            for i in items
+        ],
+    )
+
+
+def view_keys(pk, now=None):
+    """Return keys counting views of profile `pk` in the current and last window."""
+    window = int((now or time.time()) // settings.ACTIVITY_VIEW_WINDOW)
+    return ['views:%s:%s' % (pk, w) for w in (window, window - 1)]
+
+
+def record_view(pk):
+    """Count a view of profile `pk`."""
+    key = view_keys(pk)[0]
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First view in this window
+        if not cache.add(key, 1, 2 * settings.ACTIVITY_VIEW_WINDOW):
+            cache.incr(key)
+
+
+def recent_views(pks):
+    """Return {pk: views in the current and last window} of profiles `pks`."""
+    keys = {pk: view_keys(pk) for pk in pks}
+    counts = cache.get_many([k for pair in keys.values() for k in pair])
+    return {pk: sum(counts.get(k, 0) for k in pair) for pk, pair in keys.items()}
+
+
+def merge_session(session, before, after):
+    """Copy keys changed in `after` (relative to `before`) into `session`."""
+    for k, v in after.items():
+        if before.get(k) != v:
+            session[k] = v
+
+
+def lock_key(key):
+    """Return key of the single-flight lock guarding the fill of `key`."""
+    return '%s:lock' % key
+
+
+def last_key(key):
+    """Return key of the long-lived copy of `key` served when a fill stalls."""
+    return '%s:last' % key
+
+
+def fetch(session, key, sns, acct, deadline=None):
+    """Fetch `sns` activity for `acct` using a copy of `session`.
+
+    Only one process fills `key` at a time. The lock is left held by the
+    filler until `release` is called after the result is cached; other
+    callers wait up to `ACTIVITY_LOCK_WAIT` seconds for that result and then
+    fall back to the last value written. Upstream calls are bounded by
+    `deadline`.
+
+    Return (session copy, data, whether this call filled `key`).
+
+    """
+    wait_until = time.monotonic() + settings.ACTIVITY_LOCK_WAIT
+    while True:
+        if cache.add(lock_key(key), 1, settings.ACTIVITY_LOCK_TIMEOUT):
+            metrics.incr('activity:fetches')
+            try:
+                request, data = getattr(GetActivity, sns)(
+                    SessionRequest(session), acct, deadline=deadline
+                )
+            except Exception:
+                release([key])
+                raise
+            return request.session, data, True
+
+        entry = decode_entry(cache.get(key))
+        if entry:
+            metrics.incr('activity:coalesced')
+            return session, entry[0], False
+        if time.monotonic() > wait_until:
+            metrics.incr('activity:lock_fallbacks')
+            logger.warning('Timed out waiting on fill of %s.', key)
+            return session, records.loads(cache.get(last_key(key))), False
+        time.sleep(LOCK_POLL_INTERVAL)
+
+
+def revalidate(session, key, sns, acct):
+    """Refresh stale entry `key` unless another process already is.
+
+    A transiently failed fetch leaves the stale entry to be served. Meetup
+    entries are left alone while `session`'s token is expired: a token
+    refreshed here would never reach the visitor's session.
+
+    """
+    if sns == 'meetup' and meetup_token_expired(session):
+        return
+    if not cache.add(lock_key(key), 1, settings.ACTIVITY_LOCK_TIMEOUT):
+        return
+    metrics.incr('activity:revalidations')
+    try:
+        _, data = getattr(GetActivity, sns)(
+            SessionRequest(session),
+            acct,
+            deadline=Deadline(settings.ACTIVITY_UPSTREAM_DEADLINE),
+        )
+        transient = isinstance(data, records.Failure) and data.kind == records.TRANSIENT
+        if data is None or transient:
+            return
+        cache_activity({key: (sns, data)})
+        store(sns, acct, data)
+    except Exception:
+        logger.exception('Failed to refresh activity for %s.', key)
+    finally:
+        release([key])
+        # Runs outside the request cycle that would close stale connections
+        close_old_connections()
+
+
+def release(keys):
+    """Release single-flight locks held on `keys`."""
+    cache.delete_many([lock_key(key) for key in keys])
+
+
+def fetch_many(request, accounts, timeout=None):
+    """Fetch activity for several providers concurrently and cache it.
+
+    `accounts` maps cache keys to (sns, acct) pairs. Providers that haven't
+    answered within `timeout` seconds are returned in `pending`; their
+    results are cached in the background once they arrive. Upstream calls
+    of all providers share a deadline of `ACTIVITY_UPSTREAM_DEADLINE` seconds.
+    Fetches returning None aren't cached; the last value written is returned
+    instead. `Failure` markers are cached and returned as they are.
+
+    Return (request, {key: data}, pending keys).
+
+    """
+    if timeout is None:
+        timeout = settings.ACTIVITY_FETCH_DEADLINE
+
+    before = dict(request.session.items())
+    deadline = Deadline(settings.ACTIVITY_UPSTREAM_DEADLINE)
+    executor = get_executor()
+    futures = {
+        executor.submit(fetch, before, key, sns, acct, deadline): key
+        for key, (sns, acct) in accounts.items()
+    }
+    done, not_done = wait(futures, timeout=timeout)
+
+    data = {}
+    filled = {}
+    failed = []
+    for future in done:
+        key = futures[future]
+        try:
+            session, data[key], is_filler = future.result()
+        except Exception:
+            logger.exception('Failed to fetch activity for %s.', key)
+            data[key] = None
+            continue
+        merge_session(request.session, before, session)
+        if not is_filler:
+            continue
+        if data[key] is None:
+            # No data to fetch with, e.g. without a Meetup token
+            failed.append(key)
+        else:
+            filled[key] = (accounts[key][0], data[key])
+    if failed:
+        release(failed)
+        last = cache.get_many([last_key(key) for key in failed])
+        for key in failed:
+            data[key] = records.loads(last.get(last_key(key)))
+    if filled:
+        cache_activity(filled)
+        release(filled)
+        for key, (sns, activity) in filled.items():
+            store(sns, accounts[key][1], activity)
+
+    pending = []
+    for future in not_done:
+        key = futures[future]
+        logger.warning('Fetching %s exceeded %ss deadline.', key, timeout)
+        future.add_done_callback(_cache_late_result(key, *accounts[key]))
+        pending.append(key)
+
+    return request, data, pending
+
+
+def get_activity(request, profile, only=None):
+    """Return (request, {sns: data}, [sns still loading]) of `profile`, or
+    only of its account on provider `only`.
+
+    Entries within their soft expiry are served from cache. Entries past it
+    are served as well while a background refresh runs. Entries past their
+    hard expiry (or evicted) are served from stored items the same way, so
+    only accounts never fetched are fetched during the request. Failed
+    fetches are served as the last value written while transient, or None.
+
+    """
+    accounts = activity_keys(profile, only)
+    keys = {sns: key for key, (sns, _) in accounts.items()}
+    cached = get_cached(profile, only)
+    data, loading, misses = {}, [], {}
+    if 'meetup' in keys and meetup_token_expired(request.session):
+        # Background fetches work on copies of the session
+        try:
+            refresh_meetup_token(request.session)
+        except Exception:
+            logger.exception('Failed to refresh Meetup token.')
+    session = dict(request.session.items())
+    now = time.time()
+    for key, (sns, acct) in accounts.items():
+        entry = decode_entry(cached.get(key))
+        if not entry:
+            misses[key] = (sns, acct)
+            continue
+        data[sns], fresh_until = entry
+        if now > fresh_until:
+            # Read the refreshed entry from the shared cache next time
+            local_cache.get_local().delete_many([key])
+            metrics.incr('activity:stale_served')
+            get_refresh_executor().submit(revalidate, session, key, sns, acct)
+
+    for key, (sns, acct) in list(misses.items()):
+        stored = stored_activity(sns, acct)
+        if stored is None:
+            continue
+        data[sns] = stored
+        del misses[key]
+        metrics.incr('activity:stored_served')
+        get_refresh_executor().submit(revalidate, session, key, sns, acct)
+
+    if misses:
+        # Fetch uncached providers in parallel
+        request, fetched, pending = fetch_many(request, misses)
+        for key, (sns, _) in misses.items():
+            if key in pending:
+                loading.append(sns)
+            else:
+                data[sns] = fetched[key]
+    serve_failures(data, keys)
+    return request, data, loading
+
+
+def _cache_late_result(key, sns, acct):
+    """Return a callback caching the result of a fetch that missed the deadline."""
+
+    def callback(future):
+        try:
+            _, data, is_filler = future.result()
+        except Exception:
+            logger.exception('Failed to fetch activity for %s.', key)
+            return
+        if not is_filler:
+            return
+        if data is None:
+            release([key])
+            return
+        cache_activity({key: (sns, data)})
+        release([key])
+        try:
+            store(sns, acct, data)
+        finally:
+            close_old_connections()
+
+    return callback
@@ -1,2 +1,2 @@
-from .api import Meetup
+from .api import Meetup, MemberNotFound
 from .auth import OAuth2Code
@@ -7,6 +7,10 @@ import requests
 logger = logging.getLogger(__name__)
 
 
+class MemberNotFound(LookupError):
+    """Raised when a member doesn't exist."""
+
+
 class Meetup:
     """Meetup API handler
 
@@ -14,7 +18,7 @@ class Meetup:
         >>> auth.authorization_url()
         'https://secure.meetup.com/oauth2/authorize?...' # Access in web browser.
         >>> auth.get_access('https://.../callback?...')  # Pass in callback URI returned.
-        >>> meetup = Meetup(auth)
+        >>> meetup = Meetup(auth)  # Or Meetup(auth, get_session(), Deadline(8))
         >>> meetup.get_member('member_id')
         {'country': ...}
 
@@ -22,38 +26,82 @@ class Meetup:
 
     API_HOST = 'api.meetup.com'
     API_ROOT = '/'
+    # (connect, read) seconds of calls made without a deadline
+    TIMEOUT = (3.05, 10)
 
-    def __init__(self, auth):
+    def __init__(self, auth, session=None, deadline=None):
         self.auth = auth
-
-    def get_activity(self, pages=20):
-        """Retrieve activity feed for user's groups (GET /activity)"""
+        # Any object with requests' `get`; defaults to a one-off connection per call
+        self.session = session or requests
+        # Bounds the time spent on all calls; see `api.transport.Deadline`
+        self.deadline = deadline
+        # Whether the last `get_activity` crawl was cut short by the deadline
+        self.truncated = False
+
+    def get_activity(self, pages=20, since=None, member_id=None, limit=None):
+        """Retrieve activity feed for user's groups (GET /activity)
+
+        The feed is ordered newest first. Paging stops early once it reaches
+        items no newer than `since` (UTC datetime), which are left out, or
+        once `limit` items of member `member_id` have been found. When the
+        deadline runs out, the items crawled so far are returned and
+        `truncated` is set.
+
+        """
         results = []
-        next_page = None
+        found = 0
+        next_page = self._url_for_endpoint('activity')
+        self.truncated = False
         for _ in range(pages):
-            if next_page:
-                data = requests.get(next_page, auth=self.auth.apply_auth()).json()
-            else:
-                data = requests.get(
-                    self._url_for_endpoint('activity'), auth=self.auth.apply_auth()
-                ).json()
+            if self.deadline and self.deadline.expired:
+                logger.warning(
+                    'Meetup crawl stopped by deadline after %s items.', len(results)
+                )
+                self.truncated = True
+                break
+            data = self.session.get(
+                next_page,
+                auth=self.auth.apply_auth(),
+                timeout=self._timeout(),
+            ).json()
 
+            caught_up = False
             result = data.get('results')
             if result:
                 result = result if isinstance(result, list) else [result]
+                if since:
+                    new = [r for r in result if not self._is_older(r, since)]
+                    caught_up = len(new) < len(result)
+                    result = new
                 results.extend(result)
+                if member_id:
+                    found += sum(
+                        1 for r in result if r.get('member_id') == str(member_id)
+                    )
 
+            if caught_up or (limit and found >= limit):
+                break
             next_page = data.get('meta').get('next') if data.get('meta') else None
             if not next_page:
                 break
         return results
 
     def get_member(self, id='self'):
-        """Retrieve a single member"""
-        r = requests.get(
-            self._url_for_endpoint(f'members/{str(id)}'), auth=self.auth.apply_auth()
-        ).json()
+        """Retrieve a single member
+
+        Raise `MemberNotFound` if there is no such member. Return None on
+        other errors.
+
+        """
+        response = self.session.get(
+            self._url_for_endpoint(f'members/{str(id)}'),
+            auth=self.auth.apply_auth(),
+            timeout=self._timeout(),
+        )
+        r = response.json()
         if r.get('errors'):
+            if response.status_code == 404:
+                raise MemberNotFound(id)
             logger.exception('Failed to get member %s: %s', id, r.get('errors'))
             return None
         return r
@@ -73,21 +121,62 @@ class Meetup:
         """Return id member's profile URL."""
         return 'https://www.meetup.com/members/%s' % str(id)
 
-    def user_activity(self, id):
-        """Retrieve recent activity of a user in one or more of your registered groups."""
-        id = str(id)
-        data = self.get_activity()
-        activity = []
+    def user_activity(self, id, index=None):
+        """Retrieve recent activity of a user in one or more of your registered groups.
+
+        Pass `index` (see `index_activity`) to look up an already crawled feed
+        instead of crawling it again.
+
+        """
+        if index is None:
+            index = self.index_activity(self.get_activity())
+        return index.get(str(id), [])
+
+    @staticmethod
+    def index_activity(data):
+        """Return activity `data` grouped by member ID, with `created` values."""
+        index = {}
         for d in data:
-            if d.get('member_id') == id:
-                activity.append(d)
+            if not d.get('created') and d.get('published'):
+                d['created'] = Meetup._us_to_utc(d.get('published'))
+            index.setdefault(d.get('member_id'), []).append(d)
+        return index
 
-        # Add `created` values
-        for a in activity:
-            if not a.get('created') and a.get('published'):
-                a['created'] = Meetup._us_to_utc(a.get('published'))
+    @staticmethod
+    def merge_activity(index, data, limit=None):
+        """Return `index` (see `index_activity`) with activity `data` merged in.
+
+        Each member's activity is kept newest first, without duplicates, and
+        cut to `limit` items.
+
+        """
+        merged = dict(index)
+        for member_id, items in Meetup.index_activity(data).items():
+            seen = set()
+            activity = []
+            for a in sorted(
+                items + index.get(member_id, []), key=Meetup._created, reverse=True
+            ):
+                key = (a.get('published'), a.get('title'), a.get('link'))
+                if key not in seen:
+                    seen.add(key)
+                    activity.append(a)
+            merged[member_id] = activity[:limit]
+        return merged
+
+    @staticmethod
+    def _created(activity):
+        return activity.get('created') or datetime.min.replace(tzinfo=pytz.utc)
 
-        return activity
+    @staticmethod
+    def _is_older(activity, since):
+        """Return whether `activity` was published at or before `since`."""
+        created = Meetup._us_to_utc(activity.get('published'))
+        return created is not None and created <= since
+
+    def _timeout(self):
+        """Return (connect, read) timeout of the next call."""
+        return self.deadline.timeout() if self.deadline else self.TIMEOUT
 
     def _url_for_endpoint(self, endpoint):
         return 'https://' + self.API_HOST + self.API_ROOT + endpoint
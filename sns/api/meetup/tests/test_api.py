@@ -1,7 +1,7 @@
-from ..api import datetime, logging, Meetup, pytz, requests
+from ..api import datetime, logging, Meetup, MemberNotFound, pytz, requests
 
 from unittest import TestCase
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, patch, PropertyMock
 
 logger = logging.getLogger('meetup.api')
 
@@ -35,11 +35,76 @@ class TestApi(TestCase):
         self.assertEqual(len(result), len(data))
         self.assertEqual(result, [d.get('results')[0] for d in data])
 
+    @patch.object(requests, 'get')
+    def test_get_activity_stops_at_since(self, mock_get):
+        since = datetime(2019, 7, 30, tzinfo=pytz.utc)
+        data = [
+            {
+                'results': [{'published': 'Wed Jul 31 08:00:00 EDT 2019'}],
+                'meta': {'next': 'url1'},
+            },
+            {
+                'results': [
+                    {'published': 'Tue Jul 30 20:00:00 EDT 2019'},
+                    {'published': 'Sun Jun 16 08:24:49 EDT 2019'},
+                ],
+                'meta': {'next': 'url2'},
+            },
+            {'results': ['never fetched'], 'meta': {'next': ''}},
+        ]
+        mock_get.return_value.json.side_effect = data
+
+        result = self.meetup.get_activity(since=since)
+
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(
+            result,
+            [
+                {'published': 'Wed Jul 31 08:00:00 EDT 2019'},
+                {'published': 'Tue Jul 30 20:00:00 EDT 2019'},
+            ],
+        )
+
+    @patch.object(requests, 'get')
+    def test_get_activity_stops_at_member_limit(self, mock_get):
+        data = {
+            'results': [{'member_id': '1234'}, {'member_id': 'foo'}],
+            'meta': {'next': 'https://nextpageeee.com'},
+        }
+        mock_get.return_value.json.return_value = data
+
+        result = self.meetup.get_activity(member_id=1234, limit=3)
+
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(len(result), 6)
+
+    @patch.object(requests, 'get')
+    def test_get_activity_stops_at_deadline(self, mock_get):
+        data = {'results': ['result'], 'meta': {'next': 'https://nextpageeee.com'}}
+        mock_get.return_value.json.return_value = data
+        deadline = Mock(timeout=Mock(return_value=(1, 2)))
+        type(deadline).expired = PropertyMock(side_effect=[False, False, True])
+        meetup = Meetup(auth=Mock(), deadline=deadline)
+
+        result = meetup.get_activity()
+
+        self.assertEqual(result, ['result', 'result'])
+        self.assertTrue(meetup.truncated)
+        self.assertEqual(mock_get.call_args[1]['timeout'], (1, 2))
+
     @patch.object(requests, 'get')
     def test_get_activity_with_error_data(self, mock_get):
         mock_get.return_value.json.return_value = {'error': '404'}
         self.assertEqual(self.meetup.get_activity(), [])
 
+    def test_injected_session_used(self):
+        session = Mock()
+        session.get.return_value.json.return_value = {'id': '1234'}
+
+        Meetup(auth=Mock(), session=session).get_member('1234')
+
+        session.get.assert_called_once()
+
     @patch.object(requests, 'get')
     def test_get_member_with_valid_id(self, mock_get):
         response = {'id': '1234', 'last_event': 'party'}
@@ -58,6 +123,14 @@ class TestApi(TestCase):
             'Failed to get member %s: %s', id, response.get('errors')
         )
 
+    @patch.object(requests, 'get')
+    def test_get_member_not_found(self, mock_get):
+        mock_get.return_value.status_code = 404
+        mock_get.return_value.json.return_value = {'errors': [{'code': 'not_found'}]}
+
+        with self.assertRaises(MemberNotFound):
+            self.meetup.get_member('666')
+
     def test_get_member_photo_with_valid_data(self):
         data = {'photo': {'thumb_link': 'url'}}
         self.meetup.get_member = Mock(return_value=data)
@@ -90,6 +163,48 @@ class TestApi(TestCase):
         Meetup._us_to_utc = Mock(return_value=9)
         self.assertEqual(self.meetup.user_activity(id), excepted_result)
 
+    def test_user_activity_with_index(self):
+        self.meetup.get_activity = Mock()
+        index = {'1234': ['activity']}
+
+        self.assertEqual(self.meetup.user_activity(1234, index=index), ['activity'])
+        self.assertEqual(self.meetup.user_activity('666', index=index), [])
+        self.meetup.get_activity.assert_not_called()
+
+    def test_index_activity(self):
+        data = [
+            {'member_id': 'foo', 'created': 1},
+            {'member_id': 'bar', 'created': 2},
+            {'member_id': 'foo', 'created': 3},
+        ]
+        self.assertEqual(
+            Meetup.index_activity(data),
+            {
+                'foo': [
+                    {'member_id': 'foo', 'created': 1},
+                    {'member_id': 'foo', 'created': 3},
+                ],
+                'bar': [{'member_id': 'bar', 'created': 2}],
+            },
+        )
+
+    def test_merge_activity(self):
+        index = {
+            'foo': [{'member_id': 'foo', 'title': 'old', 'created': 1}],
+            'bar': [{'member_id': 'bar', 'title': 'old', 'created': 1}],
+        }
+        data = [
+            {'member_id': 'foo', 'title': 'new', 'created': 3},
+            {'member_id': 'foo', 'title': 'newer', 'created': 4},
+            # Already in index
+            {'member_id': 'foo', 'title': 'old', 'created': 1},
+        ]
+
+        merged = Meetup.merge_activity(index, data, limit=2)
+
+        self.assertEqual([a['title'] for a in merged['foo']], ['newer', 'new'])
+        self.assertEqual(merged['bar'], index['bar'])
+
     def test_us_to_utc(self):
         self.assertIsNone(self.meetup._us_to_utc('1234'))
         self.assertIsNone(self.meetup._us_to_utc('Sun Jul 14 20:00:00 2019'))
@@ -0,0 +1,77 @@
+"""Compact records of provider activity, cached as JSON.
+
+    >>> activity = Activity(url='https://...', statuses=[Status(title='Hi')])
+    >>> loads(dumps(activity)) == activity
+    True
+
+"""
+from collections import namedtuple
+from datetime import datetime, timezone
+import json
+
+# A post, comment, tweet, event or playlist with only the fields
+# `activity.html` shows, plus the provider's `id` for it. `created` is epoch
+# seconds, 0 if unknown.
+Status = namedtuple(
+    'Status',
+    'title text url img created context id',
+    defaults=('', '', '', '', 0, '', ''),
+)
+
+# A provider card. `paused_until` is the epoch a provider's rate limit resets
+# at while only previously fetched statuses are shown. `partial` is set when
+# the fetch was cut short and statuses may be missing.
+Activity = namedtuple(
+    'Activity',
+    'url img statuses paused_until partial',
+    defaults=('', '', (), None, False),
+)
+
+# Kinds of failed fetches: worth retrying soon, or not until the account is
+# edited (e.g. it doesn't exist)
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# Marker of a failed fetch, cached in place of an `Activity`. Stored as a
+# JSON object so it can't be mistaken for one.
+Failure = namedtuple('Failure', 'kind reason', defaults=('',))
+
+
+def epoch(dt):
+    """Return datetime `dt` as whole epoch seconds (0 if None).
+
+    Naive datetimes, as returned by tweepy, are taken to be UTC.
+
+    """
+    if not isinstance(dt, datetime):
+        return 0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def dumps(value):
+    """Return `value` (records nest as positional arrays) as compact JSON."""
+    return json.dumps(value, separators=(',', ':'))
+
+
+def to_activity(raw):
+    """Return the `Activity` of decoded JSON array `raw` (None stays None).
+
+    A decoded object is returned as the `Failure` it was stored from.
+
+    """
+    if raw is None:
+        return None
+    if isinstance(raw, dict):
+        return Failure(**raw)
+    url, img, statuses, *rest = raw
+    # Entries written before `partial` was added lack it
+    return Activity(url, img, [Status(*s) for s in statuses], *rest)
+
+
+def loads(value):
+    """Return the `Activity` in JSON string `value`, or None for anything else."""
+    if not isinstance(value, str):
+        return None
+    return to_activity(json.loads(value))
@@ -1,14 +1,34 @@
 from datetime import datetime
+import heapq
 import logging
+from operator import attrgetter
 import os
 from praw import Reddit as PrawReddit
+from praw.models import Comment
 from prawcore.exceptions import NotFound
 import pytz
+import requests
+import threading
 
 logger = logging.getLogger(__name__)
 
 
+class _Session(requests.Session):
+    """Session replacing prawcore's fixed 16 s timeout with `Reddit.TIMEOUT`."""
+
+    def request(self, *args, timeout=None, **kwargs):
+        return super().request(*args, timeout=Reddit.TIMEOUT, **kwargs)
+
+
 class Reddit:
+    # Long-lived clients, see `shared`
+    _local = threading.local()
+    _generation = 0
+
+    # (connect, read) per attempt; prawcore makes up to three attempts with
+    # ~6 s of backoff, which must still fit inside the activity lock timeout
+    TIMEOUT = (3.05, 5)
+
     def __init__(self, client_id=None, client_secret=None, user_agent=None):
         self.client_id = client_id or os.getenv('REDDIT_CLIENT_ID')
         self.client_secret = client_secret or os.getenv('REDDIT_CLIENT_SECRET')
@@ -19,40 +39,76 @@ class Reddit:
             client_secret=self.client_secret,
             user_agent=self.user_agent,
             read_only=True,
+            requestor_kwargs={'session': _Session()},
         )
 
-    def get_comments_submissions(self, username, num=5):
-        """Return max `num` of comments and submissions by `username`."""
-        coms = [
-            dict(
-                title=comment.link_title,
-                text=comment.body_html,
-                subreddit=comment.subreddit_name_prefixed,
-                url=comment.link_url,
-                created=datetime.fromtimestamp(comment.created_utc, pytz.utc),
-            )
-            for comment in self.api.redditor(username).comments.new(limit=num)
-        ]
-        subs = [
-            dict(
-                title=submission.title,
-                text=submission.selftext_html,
-                subreddit=submission.subreddit_name_prefixed,
-                url=submission.url,
-                created=datetime.fromtimestamp(submission.created_utc, pytz.utc),
-            )
-            for submission in self.api.redditor(username).submissions.new(limit=num)
-        ]
-        return coms + subs if len(coms + subs) < num else (coms + subs)[:num]
+    @classmethod
+    def shared(cls):
+        """Return a long-lived client for the calling thread.
+
+        PRAW isn't thread-safe, so each thread keeps its own instance (and
+        its token and connection pool). Clients aren't reused across a fork
+        or after `reset`.
+
+        """
+        local = cls._local
+        if (
+            getattr(local, 'client', None) is None
+            or local.pid != os.getpid()
+            or local.generation != cls._generation
+        ):
+            local.client = cls()
+            local.pid = os.getpid()
+            local.generation = cls._generation
+        return local.client
 
-    def profile_image_url(self, username):
+    @classmethod
+    def reset(cls):
+        """Discard shared clients, e.g. after credentials change."""
+        cls._generation += 1
+
+    def get_comments_submissions(self, username, num=5, redditor=None):
+        """Return newest `num` comments and submissions by `username`.
+
+        Both kinds come from one overview listing request. Pass `redditor`
+        to reuse an existing `Redditor` object.
+
+        """
+        redditor = redditor or self.api.redditor(username)
+        items = heapq.nlargest(
+            num, redditor.new(limit=num), key=attrgetter('created_utc')
+        )
+        return [self._status(item) for item in items]
+
+    def profile_image_url(self, username, redditor=None):
         """Return URL of user's avatar image."""
         try:
-            return self.api.redditor(username).icon_img
+            return (redditor or self.api.redditor(username)).icon_img
         except NotFound:
             logger.exception('Failed to fetch Reddit profile image of %s', username)
             return None
 
+    @staticmethod
+    def _status(item):
+        """Return dict of comment or submission `item`."""
+        if isinstance(item, Comment):
+            return dict(
+                id=item.id,
+                title=item.link_title,
+                text=item.body_html,
+                subreddit=item.subreddit_name_prefixed,
+                url=item.link_url,
+                created=datetime.fromtimestamp(item.created_utc, pytz.utc),
+            )
+        return dict(
+            id=item.id,
+            title=item.title,
+            text=item.selftext_html,
+            subreddit=item.subreddit_name_prefixed,
+            url=item.url,
+            created=datetime.fromtimestamp(item.created_utc, pytz.utc),
+        )
+
     @staticmethod
     def profile_url(username):
         """Return URL of user's profile."""
@@ -1,7 +1,16 @@
-from api.reddit.reddit import logging, NotFound, PrawReddit, Reddit
+from api.reddit.reddit import (
+    _Session,
+    Comment,
+    logging,
+    NotFound,
+    PrawReddit,
+    Reddit,
+    requests,
+)
+from praw.models import Submission
 from requests import Response
 from unittest import TestCase
-from unittest.mock import call, Mock, MagicMock, patch
+from unittest.mock import ANY, call, Mock, MagicMock, patch
 
 logger = logging.getLogger('api.reddit.reddit')
 
@@ -25,7 +34,27 @@ class RedditTests(TestCase):
             client_secret=client_secret,
             user_agent=user_agent,
             read_only=True,
+            requestor_kwargs={'session': ANY},
         )
+        session = MockPrawReddit.call_args[1]['requestor_kwargs']['session']
+        self.assertIsInstance(session, _Session)
+
+    def test_session_replaces_prawcore_timeout(self):
+        with patch.object(requests.Session, 'request') as mock_request:
+            _Session().request('GET', 'https://example.com', timeout=16)
+
+        mock_request.assert_called_once_with(
+            'GET', 'https://example.com', timeout=Reddit.TIMEOUT
+        )
+
+    def test_profile_image_url_reuses_redditor(self):
+        redditor = Mock(icon_img='url')
+
+        r = Reddit('id', 'secret', 'agent')
+        r.api = Mock()
+
+        self.assertEqual(r.profile_image_url('joe', redditor), 'url')
+        r.api.redditor.assert_not_called()
 
     @patch.object(logger, 'exception')
     def test_profile_image_url_logs_on_notfound_exception(self, mock_logger):
@@ -42,6 +71,27 @@ class RedditTests(TestCase):
         )
 
 
+@patch('api.reddit.reddit.PrawReddit', autospec=True)
+class SharedRedditTests(TestCase):
+    def setUp(self):
+        self.addCleanup(Reddit.reset)
+        Reddit.reset()
+
+    def test_shared_client_reused(self, mock_praw):
+        self.assertIs(Reddit.shared(), Reddit.shared())
+        mock_praw.assert_called_once()
+
+    def test_reset_creates_new_client(self, mock_praw):
+        client = Reddit.shared()
+        Reddit.reset()
+        self.assertIsNot(Reddit.shared(), client)
+
+    def test_new_client_after_fork(self, mock_praw):
+        client = Reddit.shared()
+        with patch('api.reddit.reddit.os.getpid', return_value=-1):
+            self.assertIsNot(Reddit.shared(), client)
+
+
 class GetCommentsSubmissionsTest(TestCase):
     def setUp(self):
         self.mock_api = MagicMock(autospec=PrawReddit)
@@ -51,92 +101,79 @@ class GetCommentsSubmissionsTest(TestCase):
 
         self.mock_datetime = patch_datetime.start()
         self.mock_pytz = patch_pytz.start()
+        # Pass timestamps through to compare ordering
+        self.mock_datetime.fromtimestamp.side_effect = lambda ts, tz: ts
 
         self.addCleanup(patch_datetime.stop)
         self.addCleanup(patch_pytz.stop)
 
-    def mock_comments_submissions(self, num=5):
-        """Return tuple of mock comments and submissions"""
-
-        # Pretend API limit at 20 results per call
-        num = num if num < 20 else 20
-
-        mock_comment = Mock()
-        mock_submission = Mock()
-
-        comment_attrs = {
-            'link_title': 'foo',
-            'body_html': 'foo',
-            'subreddit_name_prefixed': 'foo',
-            'link_url': 'foo',
-            'created_utc': 'foo',
-        }
-        submission_attrs = {
-            'title': 'bar',
-            'selftext_html': 'bar',
-            'subreddit_name_prefixed': 'bar',
-            'url': 'bar',
-            'created_utc': 'bar',
-        }
-        mock_comment.configure_mock(**comment_attrs)
-        mock_submission.configure_mock(**submission_attrs)
-
-        mock_comments = MagicMock()
-        mock_submissions = MagicMock()
-        mock_comments.new.return_value = iter([mock_comment] * num)
-        mock_submissions.new.return_value = iter([mock_submission] * num)
-
-        return mock_comments, mock_submissions
-
-    def test_comments_submissions_calls(self):
-        username = 'joe'
+    def mock_comment(self, created_utc):
+        comment = Mock(spec=Comment)
+        comment.configure_mock(
+            id='c%s' % created_utc,
+            link_title='foo',
+            body_html='foo',
+            subreddit_name_prefixed='foo',
+            link_url='foo',
+            created_utc=created_utc,
+        )
+        return comment
+
+    def mock_submission(self, created_utc):
+        submission = Mock(spec=Submission)
+        submission.configure_mock(
+            id='s%s' % created_utc,
+            title='bar',
+            selftext_html='bar',
+            subreddit_name_prefixed='bar',
+            url='bar',
+            created_utc=created_utc,
+        )
+        return submission
 
+    def reddit(self, items):
+        self.mock_api.redditor.return_value.new.return_value = iter(items)
         r = Reddit('id', 'secret', 'agent')
         r.api = self.mock_api
-        r.get_comments_submissions(username)
-
-        chained_comments = call.redditor(username).comments.new(limit=5)
-        chained_submissions = call.redditor(username).submissions.new(limit=5)
-
-        call_list_comments = chained_comments.call_list()
-        call_list_submissions = chained_submissions.call_list()
-
-        r.api.assert_has_calls(call_list_comments)
-        r.api.assert_has_calls(call_list_submissions)
+        return r
 
-    def test_num_of_results_0(self):
-        num = 0
-
-        mock_comments, mock_submissions = self.mock_comments_submissions(num)
-        self.mock_api.redditor.return_value.comments = mock_comments
-        self.mock_api.redditor.return_value.submissions = mock_submissions
+    def test_single_overview_call(self):
+        username = 'joe'
 
-        r = Reddit('id', 'secret', 'agent')
-        r.api = self.mock_api
+        r = self.reddit([])
+        r.get_comments_submissions(username)
 
-        self.assertEqual(len(r.get_comments_submissions('joe', num=num)), 0)
+        r.api.assert_has_calls(call.redditor(username).new(limit=5).call_list())
+        r.api.redditor.return_value.comments.new.assert_not_called()
+        r.api.redditor.return_value.submissions.new.assert_not_called()
 
-    def test_num_of_results_7(self):
-        num = 7
+    def test_redditor_reused(self):
+        redditor = MagicMock()
+        redditor.new.return_value = iter([])
 
-        mock_comments, mock_submissions = self.mock_comments_submissions(num)
-        self.mock_api.redditor.return_value.comments = mock_comments
-        self.mock_api.redditor.return_value.submissions = mock_submissions
+        r = self.reddit([])
+        r.get_comments_submissions('joe', redditor=redditor)
 
-        r = Reddit('id', 'secret', 'agent')
-        r.api = self.mock_api
+        redditor.new.assert_called_once_with(limit=5)
+        r.api.redditor.assert_not_called()
 
-        self.assertEqual(len(r.get_comments_submissions('joe', num=num)), 7)
+    def test_comments_and_submissions_merged_newest_first(self):
+        r = self.reddit(
+            [self.mock_comment(1), self.mock_submission(3), self.mock_comment(2)]
+        )
 
-    def test_num_of_results_100(self):
-        num = 100
+        statuses = r.get_comments_submissions('joe', num=5)
 
-        mock_comments, mock_submissions = self.mock_comments_submissions(num)
-        self.mock_api.redditor.return_value.comments = mock_comments
-        self.mock_api.redditor.return_value.submissions = mock_submissions
+        self.assertEqual([s['created'] for s in statuses], [3, 2, 1])
+        self.assertEqual([s['title'] for s in statuses], ['bar', 'foo', 'foo'])
+        self.assertEqual(statuses[1]['url'], 'foo')
+        self.assertEqual(statuses[0]['text'], 'bar')
+        self.assertEqual(statuses[0]['id'], 's3')
 
-        r = Reddit('id', 'secret', 'agent')
-        r.api = self.mock_api
+    def test_num_of_results_0(self):
+        r = self.reddit([self.mock_comment(1)] * 5)
+        self.assertEqual(len(r.get_comments_submissions('joe', num=0)), 0)
 
-        # API results limited to 20 per call
-        self.assertEqual(len(r.get_comments_submissions('joe', num=num)), 40)
+    def test_num_of_results_limited(self):
+        r = self.reddit([self.mock_comment(i) for i in range(7)])
+        self.assertEqual(len(r.get_comments_submissions('joe', num=5)), 5)
@@ -13,6 +13,9 @@ class Spotify:
         >>> spotify.get_playlists('user_id')
         {"href":...}
 
+        Shared keep-alive session and request deadline (see `api.transport`)
+        >>> spotify = Spotify(session=get_session(), deadline=Deadline(8))
+
         Authorization code flow (access to user data)
         >>> auth = OAuth2Code()
         >>> # OAuth2 dance... (see OAuth2Code docstring)
@@ -24,32 +27,45 @@ class Spotify:
 
     API_HOST = 'api.spotify.com'
     API_ROOT = '/v1/'
+    # (connect, read) seconds of calls made without a deadline
+    TIMEOUT = (3.05, 10)
 
-    def __init__(self, auth=None):
+    def __init__(self, auth=None, session=None, deadline=None):
+        # Any object with requests' `get`; defaults to a one-off connection per call
+        self.session = session or requests
+        # Bounds the time spent on all calls; see `api.transport.Deadline`
+        self.deadline = deadline
         if not auth:
             # Default to client credential flow
-            auth = OAuth2Client()
+            auth = OAuth2Client(session=session, deadline=deadline)
         self.auth = auth
 
     def get_playlists(self, id=None):
         """Retrieve playlists that user created and follows."""
         if id:
-            return requests.get(
+            return self.session.get(
                 self._url_for_endpoint(f'users/{str(id)}/playlists'),
                 auth=self.auth.apply_auth(),
+                timeout=self._timeout(),
             ).json()
-        return requests.get(
-            self._url_for_endpoint('me/playlists'), auth=self.auth.apply_auth()
+        return self.session.get(
+            self._url_for_endpoint('me/playlists'),
+            auth=self.auth.apply_auth(),
+            timeout=self._timeout(),
         ).json()
 
     def get_profile(self, id=None):
         """Return profile information."""
         if id:
-            return requests.get(
-                self._url_for_endpoint(f'users/{str(id)}'), auth=self.auth.apply_auth()
+            return self.session.get(
+                self._url_for_endpoint(f'users/{str(id)}'),
+                auth=self.auth.apply_auth(),
+                timeout=self._timeout(),
             ).json()
-        return requests.get(
-            self._url_for_endpoint('me'), auth=self.auth.apply_auth()
+        return self.session.get(
+            self._url_for_endpoint('me'),
+            auth=self.auth.apply_auth(),
+            timeout=self._timeout(),
         ).json()
 
     def profile_image_url(self, id=None):
@@ -59,5 +75,9 @@ class Spotify:
             images = profile.get('images') or []
             return images[0].get('url') if images else None
 
+    def _timeout(self):
+        """Return (connect, read) timeout of the next call."""
+        return self.deadline.timeout() if self.deadline else self.TIMEOUT
+
     def _url_for_endpoint(self, endpoint):
         return 'https://' + self.API_HOST + self.API_ROOT + endpoint
@@ -23,6 +23,8 @@ class OAuthHandler:
 
     OAUTH_HOST = 'accounts.spotify.com'
     OAUTH_ROOT = '/'
+    # (connect, read) seconds of calls made without a deadline
+    TIMEOUT = (3.05, 10)
 
     def __init__(self, client_id=None, client_secret=None, token=None):
         self.client_id = client_id or os.getenv('SPOTIFY_CLIENT_ID')
@@ -107,13 +109,16 @@ class OAuth2Client(OAuthHandler):
 
     """
 
-    def __init__(self, client_id=None, client_secret=None, token=None):
+    def __init__(
+        self, client_id=None, client_secret=None, token=None, session=None, deadline=None
+    ):
         super().__init__(client_id, client_secret, token)
         if not token:
-            r = requests.post(
+            r = (session or requests).post(
                 self._url_for_endpoint('api/token'),
                 auth=(self.client_id, self.client_secret),
                 data={'grant_type': 'client_credentials'},
+                timeout=deadline.timeout() if deadline else self.TIMEOUT,
             )
             data = r.json()
             if data.get('error'):
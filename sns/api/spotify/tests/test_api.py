@@ -17,6 +17,14 @@ class TestApi(TestCase):
         self.mock_get.return_value.json.return_value = response
         self.assertIn('items', self.spotify.get_playlists('valid_id'))
 
+    def test_calls_time_out(self):
+        self.spotify.get_playlists('valid_id')
+        self.assertEqual(self.mock_get.call_args[1]['timeout'], Spotify.TIMEOUT)
+
+        self.spotify.deadline = Mock(timeout=Mock(return_value=(1, 2)))
+        self.spotify.get_profile('valid_id')
+        self.assertEqual(self.mock_get.call_args[1]['timeout'], (1, 2))
+
     def test_get_playlists_with_invalid_id(self):
         response = {'error': '401'}
         self.mock_get.return_value.json.return_value = response
@@ -61,6 +69,15 @@ class TestApi(TestCase):
     def test_profile_image_url_with_get_profile_fail(self, mock_profile_image_url):
         self.assertEqual(self.spotify.profile_image_url('badid'), None)
 
+    def test_injected_session_used(self):
+        session = Mock()
+        session.get.return_value.json.return_value = {'items': []}
+
+        Spotify(auth=Mock(), session=session).get_playlists('valid_id')
+
+        session.get.assert_called_once()
+        self.mock_get.assert_not_called()
+
 
 class TestAuth(TestCase):
     def test_something(self):
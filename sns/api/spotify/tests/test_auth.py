@@ -136,3 +136,12 @@ class TestOAuth2Client(TestCase):
         self.mock_post.return_value = Mock(json=Mock(return_value=self.token))
         self.assertTrue(OAuth2Client(client_id='id', client_secret='secret').token)
         mock_debug.assert_called_once()
+
+    def test_injected_session_used(self):
+        session = Mock()
+        session.post.return_value = Mock(json=Mock(return_value=self.token))
+
+        OAuth2Client(client_id='id', client_secret='secret', session=session)
+
+        session.post.assert_called_once()
+        self.mock_post.assert_not_called()
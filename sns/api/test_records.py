@@ -0,0 +1,45 @@
+from datetime import datetime
+from unittest import TestCase
+
+import pytz
+
+from api.records import Activity, dumps, epoch, Failure, loads, Status, to_activity
+
+
+class RecordsTests(TestCase):
+    def test_activity_round_trips_through_json(self):
+        activity = Activity(
+            url='https://www.reddit.com/user/joe',
+            statuses=[Status(title='Hi', url='https://redd.it/1', created=1)],
+            paused_until=2,
+        )
+
+        self.assertEqual(loads(dumps(activity)), activity)
+
+    def test_json_is_positional(self):
+        self.assertEqual(
+            dumps(Activity(statuses=[Status(title='Hi')])),
+            '["","",[["Hi","","","",0,"",""]],null,false]',
+        )
+
+    def test_activity_without_partial_flag_loads(self):
+        self.assertEqual(
+            loads('["u","",[],null]'), Activity(url='u', statuses=[], partial=False)
+        )
+
+    def test_failure_loads_from_object(self):
+        failure = Failure('permanent', 'NotFound')
+
+        self.assertEqual(to_activity(failure._asdict()), failure)
+        self.assertEqual(loads(dumps(failure._asdict())), failure)
+
+    def test_other_values_load_as_none(self):
+        self.assertIsNone(loads(None))
+        self.assertIsNone(loads(({'statuses': []}, 0)))
+        self.assertIsNone(loads('null'))
+
+    def test_epoch(self):
+        self.assertEqual(epoch(datetime(1970, 1, 1, 0, 1, tzinfo=pytz.utc)), 60)
+        # tweepy returns naive UTC datetimes
+        self.assertEqual(epoch(datetime(1970, 1, 1, 0, 1)), 60)
+        self.assertEqual(epoch(None), 0)
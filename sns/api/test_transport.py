@@ -0,0 +1,95 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from requests.adapters import HTTPAdapter
+
+from api.transport import (
+    Deadline,
+    DeadlineExceeded,
+    get_session,
+    requests,
+    Session,
+    set_session,
+)
+
+
+class SessionTests(TestCase):
+    def test_default_timeout_applied(self):
+        session = Session(timeout=(1, 2))
+        with patch.object(requests.Session, 'request') as mock_request:
+            session.get('https://example.com')
+
+        self.assertEqual(mock_request.call_args[1]['timeout'], (1, 2))
+
+    def test_explicit_timeout_kept(self):
+        session = Session(timeout=(1, 2))
+        with patch.object(requests.Session, 'request') as mock_request:
+            session.get('https://example.com', timeout=5)
+
+        self.assertEqual(mock_request.call_args[1]['timeout'], 5)
+
+    def test_deadline_bounded_calls_not_retried(self):
+        session = Session(pool_size=3, retries=4)
+        with patch.object(HTTPAdapter, 'send', autospec=True) as mock_send:
+            mock_send.return_value.is_redirect = False
+            session.get('https://example.com', timeout=Deadline(5).timeout())
+            bounded = mock_send.call_args[0][0]
+            session.get('https://example.com')
+            default = mock_send.call_args[0][0]
+
+        self.assertEqual(bounded.max_retries.total, 0)
+        self.assertEqual(default.max_retries.total, 4)
+
+    def test_adapter_pool_size_and_retries(self):
+        adapter = Session(pool_size=3, retries=4).get_adapter('https://example.com')
+
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertEqual(adapter.max_retries.total, 4)
+
+
+class DeadlineTests(TestCase):
+    @patch('api.transport.time.monotonic')
+    def test_timeout_capped_to_time_left(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        deadline = Deadline(5)
+
+        self.assertEqual(deadline.timeout((3, 10)), (3, 5))
+        mock_monotonic.return_value = 104
+        self.assertEqual(deadline.timeout((3, 10)), (1, 1))
+        self.assertFalse(deadline.expired)
+
+    @patch('api.transport.time.monotonic')
+    def test_no_calls_once_expired(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        deadline = Deadline(5)
+        mock_monotonic.return_value = 106
+
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.timeout()
+
+
+class SharedSessionTests(TestCase):
+    def setUp(self):
+        self.addCleanup(set_session, set_session(None))
+
+    def test_session_created_once(self):
+        session = get_session()
+
+        self.assertIsInstance(session, Session)
+        self.assertIs(get_session(), session)
+
+    def test_set_session_swaps_and_returns_previous(self):
+        session = get_session()
+        stub = Mock()
+
+        self.assertIs(set_session(stub), session)
+        self.assertIs(get_session(), stub)
+
+    @patch('api.transport.os.getpid')
+    def test_new_session_after_fork(self, mock_getpid):
+        mock_getpid.return_value = 1
+        session = get_session()
+        mock_getpid.return_value = 2
+
+        self.assertIsNot(get_session(), session)
@@ -1,14 +1,34 @@
 from collections import namedtuple
+from datetime import datetime
 import logging
+import time
 from unittest import TestCase
-from unittest.mock import patch
-from api.utils import GetActivity
+from unittest.mock import Mock, patch
+import api.utils
+from api.twitter import Twitter
+from api.meetup import Meetup, MemberNotFound
+from api.records import Failure, PERMANENT, Status, TRANSIENT
+from api.transport import Deadline, DeadlineExceeded
+from prawcore.exceptions import NotFound
+from tweepy import RateLimitError, TweepError
+from api.utils import (
+    BREAKER_FAILURES,
+    CircuitBreaker,
+    failure,
+    GetActivity,
+    MEETUP_ACTIVITY_LIMIT,
+    MEETUP_FEED_TTL,
+    meetup_feed,
+    spotify_app_token,
+    SPOTIFY_TOKEN_LOCK,
+)
 
 logger = logging.getLogger('api.utils')
 
 # mocked request obj
 Request = namedtuple('Request', 'headers, session')
 
+
 class TestGetActivity(TestCase):
     """Test exception handling"""
 
@@ -16,6 +36,13 @@ class TestGetActivity(TestCase):
         self.mock_request = Request(headers={}, session={})
         self.id = 'jimmy'
 
+        self.failed = Failure(TRANSIENT, 'Exception')
+
+        self.cache = DictCache()
+        patch_cache = patch('api.utils.cache', self.cache)
+        patch_cache.start()
+        self.addCleanup(patch_cache.stop)
+
         patch_exception = patch.object(logger, 'exception')
         self.mock_exception = patch_exception.start()
         self.addCleanup(patch_exception.stop)
@@ -27,35 +54,551 @@ class TestGetActivity(TestCase):
         self.mock_request.session['meetup_token'] = 'xxx'
 
         self.assertEqual(
-            GetActivity().meetup(self.mock_request, self.id), (self.mock_request, None)
+            GetActivity().meetup(self.mock_request, self.id),
+            (self.mock_request, self.failed),
         )
         self.mock_exception.assert_called_once_with(
             'Failed to fetch data from Meetup API.'
         )
 
+    def meetup_cut_short(self, mock_meetupoauth, mock_feed, activity):
+        """Fetch Meetup activity with a crawl finding `activity` for `self.id`
+        before the deadline runs out."""
+        mock_meetupoauth.return_value.is_token_expired.return_value = False
+        self.mock_request.session['meetup_token'] = 'xxx'
+        self.mock_request.session['meetup_member_id'] = '1'
+        deadline = Mock(expired=False)
+
+        def crawl(meetup, owner, member_id):
+            meetup.truncated = True
+            deadline.expired = True
+            return {self.id: activity}
+
+        mock_feed.side_effect = crawl
+        return GetActivity().meetup(self.mock_request, self.id, deadline=deadline)[1]
+
+    @patch('api.utils.meetup_feed')
+    @patch('api.utils.get_session')
+    @patch('api.utils.MeetupOAuth', autospec=True)
+    def test_meetup_crawl_cut_short_served_as_partial(
+        self, mock_meetupoauth, mock_session, mock_feed
+    ):
+        data = self.meetup_cut_short(
+            mock_meetupoauth, mock_feed, [{'title': 'Party', 'link': 'l'}]
+        )
+
+        self.assertTrue(data.partial)
+        self.assertEqual(data.img, '')
+        self.assertEqual([s.title for s in data.statuses], ['Party'])
+        mock_session.return_value.get.assert_not_called()
+
+    @patch('api.utils.meetup_feed')
+    @patch('api.utils.get_session')
+    @patch('api.utils.MeetupOAuth', autospec=True)
+    def test_meetup_crawl_cut_short_without_items_fails(
+        self, mock_meetupoauth, mock_session, mock_feed
+    ):
+        data = self.meetup_cut_short(mock_meetupoauth, mock_feed, [])
+
+        self.assertEqual(data, Failure(TRANSIENT, 'DeadlineExceeded'))
+
+    @patch('api.utils.spotify_app_token', return_value={'access_token': 'xxx'})
     @patch('api.utils.Spotify', side_effect=Exception('Boom!'), autospec=True)
-    def test_spotify(self, mock_spotify):
+    def test_spotify(self, mock_spotify, mock_token):
         self.assertEqual(
-            GetActivity().spotify(self.mock_request, self.id), (self.mock_request, None)
+            GetActivity().spotify(self.mock_request, self.id),
+            (self.mock_request, self.failed),
         )
         self.mock_exception.assert_called_once_with(
             'Failed to fetch data from Spotify API.'
         )
 
-    @patch('api.utils.Reddit', side_effect=Exception('Boom!'), autospec=True)
+    @patch('api.utils.Reddit.shared', side_effect=Exception('Boom!'))
     def test_reddit(self, mock_spotify):
         self.assertEqual(
-            GetActivity().reddit(self.mock_request, self.id), (self.mock_request, None)
+            GetActivity().reddit(self.mock_request, self.id),
+            (self.mock_request, self.failed),
         )
         self.mock_exception.assert_called_once_with(
             'Failed to fetch data from Reddit API.'
         )
 
-    @patch('api.utils.Twitter', side_effect=Exception('Boom!'), autospec=True)
+    @patch('api.utils.Twitter.shared', side_effect=Exception('Boom!'))
     def test_twitter(self, mock_twitter):
         self.assertEqual(
-            GetActivity().twitter(self.mock_request, self.id), (self.mock_request, None)
+            GetActivity().twitter(self.mock_request, self.id),
+            (self.mock_request, self.failed),
         )
         self.mock_exception.assert_called_once_with(
             'Failed to fetch data from Twitter API.'
         )
+
+    @patch('api.utils.Reddit.shared', side_effect=Exception('Boom!'))
+    def test_open_circuit_fails_fast(self, mock_reddit):
+        for _ in range(BREAKER_FAILURES):
+            GetActivity().reddit(self.mock_request, self.id)
+
+        self.assertEqual(
+            GetActivity().reddit(self.mock_request, self.id),
+            (self.mock_request, Failure(TRANSIENT, 'CircuitOpen')),
+        )
+        self.assertEqual(mock_reddit.call_count, BREAKER_FAILURES)
+        self.assertEqual(CircuitBreaker.state('reddit')['state'], 'open')
+
+    @patch('api.utils.Reddit.shared')
+    def test_missing_account_is_permanent_failure(self, mock_reddit):
+        mock_reddit.return_value.get_comments_submissions.side_effect = NotFound(
+            Mock(status_code=404)
+        )
+
+        for _ in range(BREAKER_FAILURES):
+            _, data = GetActivity().reddit(self.mock_request, self.id)
+
+        self.assertEqual(data, Failure(PERMANENT, 'NotFound'))
+        # The provider itself is up
+        self.assertEqual(CircuitBreaker.state('reddit')['state'], 'closed')
+
+    @patch('api.utils.spotify_app_token', return_value={'access_token': 'xxx'})
+    @patch('api.utils.Spotify', autospec=True)
+    def test_spotify_error_responses(self, mock_spotify, mock_token):
+        get_playlists = mock_spotify.return_value.get_playlists
+        get_playlists.return_value = {'error': {'status': 404}}
+        self.assertEqual(
+            GetActivity().spotify(self.mock_request, self.id)[1],
+            Failure(PERMANENT, 'AccountNotFound'),
+        )
+
+        get_playlists.return_value = {'error': {'status': 502}}
+        self.assertEqual(
+            GetActivity().spotify(self.mock_request, self.id)[1],
+            Failure(TRANSIENT, 'RuntimeError'),
+        )
+
+    @patch('api.utils.Reddit.shared')
+    def test_expired_deadline_skips_provider(self, mock_reddit):
+        for _ in range(BREAKER_FAILURES):
+            _, data = GetActivity().reddit(
+                self.mock_request, self.id, deadline=Deadline(0)
+            )
+
+        self.assertEqual(data, Failure(TRANSIENT, 'DeadlineExceeded'))
+        mock_reddit.assert_not_called()
+        self.assertEqual(CircuitBreaker.state('reddit')['state'], 'closed')
+
+    @patch('api.utils.Reddit.shared')
+    def test_deadline_exceeded_not_counted_against_provider(self, mock_reddit):
+        mock_reddit.side_effect = DeadlineExceeded('No time left')
+
+        for _ in range(BREAKER_FAILURES):
+            _, data = GetActivity().reddit(self.mock_request, self.id)
+
+        self.assertEqual(data, Failure(TRANSIENT, 'DeadlineExceeded'))
+        self.assertEqual(CircuitBreaker.state('reddit')['failures'], 0)
+
+    def test_failure_kinds(self):
+        self.assertEqual(failure(MemberNotFound('1')).kind, PERMANENT)
+        self.assertEqual(failure(TweepError('', api_code=50)).kind, PERMANENT)
+        # Protected timeline
+        self.assertEqual(
+            failure(TweepError('', response=Mock(status_code=401))).kind, PERMANENT
+        )
+        # Bad app token
+        self.assertEqual(
+            failure(TweepError('', response=Mock(status_code=401), api_code=89)).kind,
+            TRANSIENT,
+        )
+        self.assertEqual(
+            failure(TweepError('', response=Mock(status_code=503))).kind, TRANSIENT
+        )
+        self.assertEqual(failure(TimeoutError()).kind, TRANSIENT)
+
+
+class TestCircuitBreaker(TestCase):
+    def setUp(self):
+        self.cache = DictCache()
+        patch_cache = patch('api.utils.cache', self.cache)
+        patch_cache.start()
+        self.addCleanup(patch_cache.stop)
+
+    def open(self):
+        breaker = CircuitBreaker('spotify')
+        for _ in range(BREAKER_FAILURES):
+            self.assertTrue(breaker.allow())
+            breaker.failure()
+        # Open period over
+        del self.cache['breaker:spotify:open']
+
+    def test_opens_after_failures_in_window(self):
+        breaker = CircuitBreaker('spotify')
+        for _ in range(BREAKER_FAILURES - 1):
+            breaker.failure()
+        self.assertEqual(CircuitBreaker.state('spotify')['failures'], 4)
+        self.assertTrue(breaker.allow())
+
+        breaker.failure()
+
+        self.assertFalse(breaker.allow())
+        self.assertEqual(CircuitBreaker.state('spotify')['state'], 'open')
+
+    def test_single_probe_when_half_open(self):
+        self.open()
+        self.assertEqual(CircuitBreaker.state('spotify')['state'], 'half-open')
+
+        probe = CircuitBreaker('spotify')
+        self.assertTrue(probe.allow())
+        self.assertFalse(CircuitBreaker('spotify').allow())
+
+        probe.success()
+
+        self.assertEqual(
+            CircuitBreaker.state('spotify'),
+            {'state': 'closed', 'failures': 0, 'open_until': None},
+        )
+        self.assertTrue(CircuitBreaker('spotify').allow())
+
+    def test_failed_probe_opens_again(self):
+        self.open()
+        probe = CircuitBreaker('spotify')
+        probe.allow()
+
+        probe.failure()
+
+        self.assertEqual(CircuitBreaker.state('spotify')['state'], 'open')
+        self.assertFalse(CircuitBreaker('spotify').allow())
+
+    def test_abandoned_probe_lets_another_through(self):
+        self.open()
+        probe = CircuitBreaker('spotify')
+        probe.allow()
+
+        probe.abandon()
+
+        self.assertEqual(CircuitBreaker.state('spotify')['state'], 'half-open')
+        self.assertTrue(CircuitBreaker('spotify').allow())
+
+
+class DictCache(dict):
+    """Minimal stand-in for the Django cache API"""
+
+    def get(self, key, default=None):
+        return super().get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self[key] = value
+
+    def add(self, key, value, timeout=None):
+        if key in self:
+            return False
+        self[key] = value
+        return True
+
+    def delete(self, key):
+        self.pop(key, None)
+
+    def get_many(self, keys):
+        return {k: self[k] for k in keys if k in self}
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def incr(self, key):
+        if key not in self:
+            raise ValueError(key)
+        self[key] += 1
+        return self[key]
+
+
+@patch('api.utils.get_session')
+@patch('api.utils.SpotifyOAuth')
+class TestSpotifyAppToken(TestCase):
+    def setUp(self):
+        self.cache = DictCache()
+        patch_cache = patch('api.utils.cache', self.cache)
+        patch_cache.start()
+        self.addCleanup(patch_cache.stop)
+
+        patch_token = patch.object(api.utils, '_spotify_token', {})
+        patch_token.start()
+        self.addCleanup(patch_token.stop)
+
+    def token(self, expires_in):
+        return {'access_token': 'xxx', 'expires_at': time.time() + expires_in}
+
+    def test_renews_and_shares_token(self, mock_oauth, mock_session):
+        token = self.token(3600)
+        mock_oauth.return_value.token = token
+
+        self.assertEqual(spotify_app_token(), token)
+        self.assertEqual(self.cache['spotify:app_token'], token)
+        self.assertNotIn(SPOTIFY_TOKEN_LOCK, self.cache)
+
+    def test_reuses_token_from_cache(self, mock_oauth, mock_session):
+        token = self.token(3600)
+        self.cache['spotify:app_token'] = token
+
+        self.assertEqual(spotify_app_token(), token)
+        # In-process copy is used from then on
+        self.cache.clear()
+        self.assertEqual(spotify_app_token(), token)
+        mock_oauth.assert_not_called()
+
+    def test_renews_token_about_to_expire(self, mock_oauth, mock_session):
+        self.cache['spotify:app_token'] = self.token(10)
+        mock_oauth.return_value.token = self.token(3600)
+
+        self.assertEqual(spotify_app_token(), mock_oauth.return_value.token)
+
+    def test_uses_valid_token_while_other_process_renews(
+        self, mock_oauth, mock_session
+    ):
+        token = self.token(10)
+        self.cache['spotify:app_token'] = token
+        self.cache[SPOTIFY_TOKEN_LOCK] = 1
+
+        self.assertEqual(spotify_app_token(), token)
+        mock_oauth.assert_not_called()
+
+
+class TestSpotifyAppTokenRenewal(TestCase):
+    """Renewal through a real `OAuth2Client` against a stub session"""
+
+    def setUp(self):
+        self.cache = DictCache()
+        patch_cache = patch('api.utils.cache', self.cache)
+        patch_cache.start()
+        self.addCleanup(patch_cache.stop)
+
+        patch_token = patch.object(api.utils, '_spotify_token', {})
+        patch_token.start()
+        self.addCleanup(patch_token.stop)
+
+        self.session = Mock()
+        self.session.post.return_value.json.return_value = {
+            'access_token': 'xxx',
+            'token_type': 'bearer',
+            'expires_in': 3600,
+        }
+        patch_session = patch('api.utils.get_session', return_value=self.session)
+        patch_session.start()
+        self.addCleanup(patch_session.stop)
+
+    def test_renews_without_deadline(self):
+        token = spotify_app_token()
+
+        self.assertEqual(token['access_token'], 'xxx')
+        self.assertEqual(self.cache['spotify:app_token'], token)
+        self.assertEqual(self.session.post.call_args[1]['timeout'], (3.05, 10))
+
+    def test_renewal_bounded_by_deadline(self):
+        spotify_app_token(deadline=Deadline(2))
+
+        connect, read = self.session.post.call_args[1]['timeout']
+        self.assertLessEqual(connect, 2)
+        self.assertLessEqual(read, 2)
+
+
+class TestMeetupFeed(TestCase):
+    def setUp(self):
+        self.cache = DictCache()
+        patch_cache = patch('api.utils.cache', self.cache)
+        patch_cache.start()
+        self.addCleanup(patch_cache.stop)
+
+        self.meetup = Mock(merge_activity=Meetup.merge_activity, truncated=False)
+
+    def activity(self, member_id, created):
+        return {'member_id': member_id, 'title': str(created), 'created': created}
+
+    def test_feed_crawled_once_per_owner(self):
+        self.meetup.get_activity.return_value = [self.activity('1234', 1)]
+
+        self.assertEqual(
+            meetup_feed(self.meetup, 'owner', '1234')['1234'][0]['created'], 1
+        )
+        meetup_feed(self.meetup, 'owner', '1234')
+        meetup_feed(self.meetup, 'other owner', '1234')
+
+        self.assertEqual(self.meetup.get_activity.call_count, 2)
+        self.meetup.get_activity.assert_called_with(
+            member_id='1234', limit=MEETUP_ACTIVITY_LIMIT
+        )
+
+    def test_complete_feed_serves_other_members(self):
+        self.meetup.get_activity.return_value = [self.activity('1234', 1)]
+        meetup_feed(self.meetup, 'owner', '1234')
+
+        self.assertEqual(meetup_feed(self.meetup, 'owner', 'foo').get('foo'), None)
+        self.meetup.get_activity.assert_called_once()
+
+    def test_partial_feed_crawled_for_missing_member(self):
+        self.meetup.get_activity.return_value = [
+            self.activity('1234', i) for i in range(1, MEETUP_ACTIVITY_LIMIT + 1)
+        ]
+        meetup_feed(self.meetup, 'owner', '1234')
+
+        self.meetup.get_activity.return_value = [self.activity('foo', 1)]
+        index = meetup_feed(self.meetup, 'owner', 'foo')
+
+        self.assertEqual(len(index['1234']), MEETUP_ACTIVITY_LIMIT)
+        self.assertEqual(len(index['foo']), 1)
+
+    def test_stale_feed_crawled_since_watermark(self):
+        self.meetup.get_activity.return_value = [self.activity('1234', 1)]
+        meetup_feed(self.meetup, 'owner', '1234')
+        self.cache['meetup:feed:owner']['fetched_at'] -= MEETUP_FEED_TTL + 1
+
+        self.meetup.get_activity.return_value = [self.activity('1234', 2)]
+        index = meetup_feed(self.meetup, 'owner', '1234')
+
+        self.meetup.get_activity.assert_called_with(since=1)
+        self.assertEqual([a['created'] for a in index['1234']], [2, 1])
+        self.assertEqual(self.cache['meetup:feed:owner']['watermark'], 2)
+
+    def test_crawl_cut_short_by_deadline_is_retried(self):
+        self.meetup.truncated = True
+        self.meetup.get_activity.return_value = [self.activity('1234', 1)]
+        meetup_feed(self.meetup, 'owner', '1234')
+        self.assertFalse(self.cache['meetup:feed:owner']['complete'])
+
+        self.cache['meetup:feed:owner']['complete'] = True
+        self.cache['meetup:feed:owner']['fetched_at'] -= MEETUP_FEED_TTL + 1
+        self.meetup.get_activity.return_value = [self.activity('1234', 2)]
+        index = meetup_feed(self.meetup, 'owner', '1234')
+
+        # New items aren't merged past a gap; the watermark stays put
+        self.assertEqual([a['created'] for a in index['1234']], [1])
+        self.assertEqual(self.cache['meetup:feed:owner']['watermark'], 1)
+
+
+class TestTwitterErrors(TestCase):
+    """Errors raised by a real `Twitter` client through `GetActivity.twitter`"""
+
+    def setUp(self):
+        self.cache = DictCache()
+        patch_cache = patch('api.utils.cache', self.cache)
+        patch_cache.start()
+        self.addCleanup(patch_cache.stop)
+
+        for target in ('AppAuthHandler', 'API'):
+            patch_tweepy = patch('api.twitter.twitter.tweepy.' + target)
+            patch_tweepy.start()
+            self.addCleanup(patch_tweepy.stop)
+        Twitter.reset()
+        self.addCleanup(Twitter.reset)
+        self.timeline = Twitter.shared().api.user_timeline
+
+        patch_exception = patch.object(logger, 'exception')
+        patch_exception.start()
+        self.addCleanup(patch_exception.stop)
+
+        self.request = Request(headers={}, session={})
+
+    def test_missing_user_is_permanent_failure(self):
+        self.timeline.side_effect = TweepError(
+            'Sorry, that page does not exist.',
+            response=Mock(status_code=404),
+            api_code=34,
+        )
+
+        _, data = GetActivity.twitter(self.request, 'joe')
+
+        self.assertEqual(data, Failure(PERMANENT, 'TweepError'))
+        self.assertNotIn('twitter:timeline:joe', self.cache)
+        self.assertNotIn(CircuitBreaker.keys('twitter')[0], self.cache)
+
+    def test_server_error_is_transient_failure(self):
+        self.timeline.side_effect = TweepError(
+            'Over capacity', response=Mock(status_code=503), api_code=130
+        )
+
+        _, data = GetActivity.twitter(self.request, 'joe')
+
+        self.assertEqual(data, Failure(TRANSIENT, 'TweepError'))
+        self.assertEqual(self.cache[CircuitBreaker.keys('twitter')[0]], 1)
+
+
+class TestTwitterTimeline(TestCase):
+    def setUp(self):
+        self.cache = DictCache()
+        patch_cache = patch('api.utils.cache', self.cache)
+        patch_cache.start()
+        self.addCleanup(patch_cache.stop)
+
+        patch_twitter = patch('api.utils.Twitter.shared')
+        self.twitter = patch_twitter.start().return_value
+        self.twitter.rate_limit.return_value = (100, time.time() + 900)
+        self.addCleanup(patch_twitter.stop)
+
+        self.request = Request(headers={}, session={})
+
+    def test_newest_status_id_remembered(self):
+        tweets = [
+            {'status_id': '2', 'text': 'b', 'created': None, 'img': 'img'},
+            {'status_id': '1', 'text': 'a', 'created': None, 'img': 'img'},
+        ]
+        self.twitter.get_tweets.return_value = tweets
+
+        GetActivity.twitter(self.request, 'joe')
+        GetActivity.twitter(self.request, 'joe')
+
+        self.twitter.get_tweets.assert_called_with(
+            id='joe', num=5, since_id='2', tweets=tweets
+        )
+        self.assertEqual(
+            self.cache['twitter:timeline:joe'], {'since_id': '2', 'tweets': tweets}
+        )
+
+    def test_budget_recorded_from_rate_limit_headers(self):
+        self.twitter.get_tweets.return_value = []
+
+        _, data = GetActivity.twitter(self.request, 'joe')
+
+        self.assertEqual(
+            self.cache['twitter:budget:statuses/user_timeline'],
+            self.twitter.rate_limit.return_value,
+        )
+        self.assertIsNone(data.paused_until)
+
+    def test_cached_tweets_served_while_budget_spent(self):
+        tweets = [
+            {
+                'status_id': '1',
+                'text': 'hi',
+                'created': datetime(2020, 1, 1, 12),
+                'img': 'img',
+            }
+        ]
+        reset = int(time.time()) + 600
+        self.cache['twitter:timeline:joe'] = {'since_id': '1', 'tweets': tweets}
+        self.cache['twitter:budget:statuses/user_timeline'] = (0, reset)
+
+        _, data = GetActivity.twitter(self.request, 'joe')
+
+        self.twitter.get_tweets.assert_not_called()
+        self.assertEqual(
+            data.statuses,
+            [
+                Status(
+                    text='hi',
+                    url='https://twitter.com/joe/status/1',
+                    created=1577880000,
+                    id='1',
+                )
+            ],
+        )
+        self.assertEqual(data.img, 'img')
+        self.assertEqual(data.paused_until, reset)
+
+    def test_rate_limit_error_pauses_until_reset(self):
+        reset = int(time.time()) + 600
+        self.twitter.get_tweets.side_effect = RateLimitError('Rate limited')
+        self.twitter.rate_limit.return_value = (0, reset)
+
+        _, data = GetActivity.twitter(self.request, 'joe')
+
+        # Nothing fetched before to show while paused
+        self.assertEqual(data, Failure(TRANSIENT, 'RateLimited'))
+        self.assertEqual(
+            self.cache['twitter:budget:statuses/user_timeline'], (0, reset)
+        )
@@ -0,0 +1,131 @@
+"""Process-wide pooled HTTP session shared by API clients.
+
+    >>> session = get_session()
+    >>> session.get('https://api.spotify.com/v1/...')
+    <Response [200]>
+
+    >>> # Swap in a stub (e.g. in tests); returns the replaced session
+    >>> previous = set_session(Mock())
+
+    >>> # Bound all calls made for one request to 8 seconds in total
+    >>> deadline = Deadline(8)
+    >>> session.get('https://api.spotify.com/v1/...', timeout=deadline.timeout())
+
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Max connections kept alive per host
+POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+# Retries of failed connections and 5xx responses to idempotent requests
+RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+
+class Session(requests.Session):
+    """Keep-alive session with a bounded connection pool, retries and
+    a default (connect, read) timeout on every request.
+
+    Calls made with a `Deadline`'s timeout aren't retried: each attempt
+    would get the whole timeout again and overrun the deadline.
+
+    """
+
+    def __init__(
+        self,
+        pool_size=POOL_SIZE,
+        retries=RETRIES,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+    ):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=0.3,
+                status_forcelist=(500, 502, 503, 504),
+                raise_on_status=False,
+            ),
+        )
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self._no_retries = HTTPAdapter(pool_maxsize=pool_size, max_retries=0)
+        # Whether the calling thread's request is bounded by a deadline
+        self._local = threading.local()
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        self._local.bounded = isinstance(kwargs['timeout'], DeadlineTimeout)
+        try:
+            return super().request(*args, **kwargs)
+        finally:
+            self._local.bounded = False
+
+    def get_adapter(self, url):
+        if getattr(self._local, 'bounded', False):
+            return self._no_retries
+        return super().get_adapter(url)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call is made with no time left on its `Deadline`."""
+
+
+class DeadlineTimeout(tuple):
+    """(connect, read) timeout capped by a `Deadline`."""
+
+
+class Deadline:
+    """Time left for the upstream calls made on behalf of one request."""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """Return seconds left, or 0 once expired."""
+        return max(self.expires_at - time.monotonic(), 0)
+
+    @property
+    def expired(self):
+        return not self.remaining()
+
+    def timeout(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        """Return (connect, read) `timeout` capped to the time left."""
+        remaining = self.remaining()
+        if not remaining:
+            raise DeadlineExceeded('No time left for upstream call.')
+        return DeadlineTimeout(min(t, remaining) for t in timeout)
+
+
+def get_session():
+    """Return the shared session, creating it on first use in this process."""
+    global _session, _session_pid
+    with _lock:
+        # Connections must not be shared with a forked parent
+        if _session is None or _session_pid != os.getpid():
+            _session = Session()
+            _session_pid = os.getpid()
+            logger.debug('Created HTTP session with pool size %s', POOL_SIZE)
+        return _session
+
+
+def set_session(session):
+    """Replace the shared session with `session`. Return the previous one."""
+    global _session, _session_pid
+    with _lock:
+        previous, _session, _session_pid = _session, session, os.getpid()
+    return previous
@@ -1,14 +1,15 @@
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
-from api.twitter.twitter import logging, Twitter
-
-logger = logging.getLogger('twitter')
+from api.twitter.twitter import Twitter
+from tweepy import RateLimitError, TweepError
 
 
 class TwitterTests(TestCase):
     def setUp(self):
-        patch_appauth = patch('api.twitter.twitter.tweepy.AppAuthHandler', autospec=True)
+        patch_appauth = patch(
+            'api.twitter.twitter.tweepy.AppAuthHandler', autospec=True
+        )
         patch_api = patch('api.twitter.twitter.tweepy.API', autospec=True)
 
         self.mock_appauth = patch_appauth.start()
@@ -21,23 +22,67 @@ class TwitterTests(TestCase):
         Twitter('id', 'secret')
 
         self.mock_appauth.assert_called_once_with('id', 'secret')
-        self.mock_api.assert_called_once()
+        self.mock_api.assert_called_once_with(
+            self.mock_appauth.return_value, timeout=Twitter.TIMEOUT
+        )
+
+    def test_timeline_called_when_get_tweets_called(self):
+        id = '123'
+        api = Twitter('id', 'secret')
 
-    def test_cursor_called_when_get_tweets_called(self):
+        api.get_tweets(id)
+
+        api.api.user_timeline.assert_called_once_with(id=id, count=10)
+
+    def test_new_tweets_merged_since_id(self):
         id = '123'
         api = Twitter('id', 'secret')
+        api.api.user_timeline.return_value = [
+            Mock(id_str='3', text='new', created_at=3, user=Mock(profile_image_url='img'))
+        ]
+        tweets = [
+            {'status_id': '2', 'text': 'old', 'created': 2, 'img': 'img'},
+            {'status_id': '1', 'text': 'older', 'created': 1, 'img': 'img'},
+        ]
+
+        result = api.get_tweets(id, num=2, since_id='2', tweets=tweets)
+
+        api.api.user_timeline.assert_called_once_with(id=id, count=2, since_id='2')
+        self.assertEqual([t['status_id'] for t in result], ['3', '2'])
+        self.assertEqual(result[0]['img'], 'img')
 
-        with patch('tweepy.Cursor', autospec=True) as mock_cursor:
-            api.get_tweets(id)
+    def test_api_error_raised(self):
+        api = Twitter('id', 'secret')
+        api.api.user_timeline.side_effect = TweepError('Boom!')
 
-        mock_cursor.assert_called_once_with(api.api.user_timeline, id=id)
+        with self.assertRaises(TweepError):
+            api.get_tweets('123')
 
-    @patch.object(logger, 'exception')
-    def test_nothing_returned_when_exception_called(self, mock_exception):
+    def test_rate_limit_error_raised(self):
         api = Twitter('id', 'secret')
+        api.api.user_timeline.side_effect = RateLimitError('Rate limited')
 
-        with patch('tweepy.Cursor', side_effect=mock_exception, autospec=True) as mock_cursor:
+        with self.assertRaises(RateLimitError):
             api.get_tweets('123')
 
-        mock_cursor.assert_called_once()
-        mock_exception.assert_called_once()
+    def test_rate_limit_read_from_last_response(self):
+        api = Twitter('id', 'secret')
+        api.api.last_response = Mock(
+            headers={'x-rate-limit-remaining': '3', 'x-rate-limit-reset': '1600000000'}
+        )
+
+        self.assertEqual(api.rate_limit(), (3, 1600000000))
+
+        api.api.last_response = None
+        self.assertIsNone(api.rate_limit())
+
+    def test_shared_client_reused_until_reset(self):
+        self.addCleanup(Twitter.reset)
+        Twitter.reset()
+
+        client = Twitter.shared()
+        self.assertIs(Twitter.shared(), client)
+        self.mock_appauth.assert_called_once()
+
+        Twitter.reset()
+        self.assertIsNot(Twitter.shared(), client)
@@ -1,11 +1,22 @@
 import logging
 import os
+import threading
 import tweepy
 
 logger = logging.getLogger(__name__)
 
 
 class Twitter:
+    # Rate-limited endpoint used by `get_tweets`
+    TIMELINE = 'statuses/user_timeline'
+
+    # Seconds; well under the activity lock timeout (tweepy defaults to 60)
+    TIMEOUT = 10
+
+    # Long-lived clients, see `shared`
+    _local = threading.local()
+    _generation = 0
+
     def __init__(self, consumer_key=None, consumer_secret_key=None):
         self.consumer_key = consumer_key or os.getenv('TWITTER_CONSUMER_KEY')
         self.consumer_secret_key = consumer_secret_key or os.getenv(
@@ -13,26 +24,71 @@ class Twitter:
         )
 
         auth = tweepy.AppAuthHandler(self.consumer_key, self.consumer_secret_key)
-        self.api = tweepy.API(
-            auth, wait_on_rate_limit=True, wait_on_rate_limit_notify=True
-        )
+        # Never sleep on rate limits inside a web worker; see `rate_limit`
+        self.api = tweepy.API(auth, timeout=self.TIMEOUT)
+
+    @classmethod
+    def shared(cls):
+        """Return a long-lived client for the calling thread.
+
+        Each thread keeps its own instance since tweepy stores the last
+        response on the API object. Clients aren't reused across a fork or
+        after `reset`.
+
+        """
+        local = cls._local
+        if (
+            getattr(local, 'client', None) is None
+            or local.pid != os.getpid()
+            or local.generation != cls._generation
+        ):
+            local.client = cls()
+            local.pid = os.getpid()
+            local.generation = cls._generation
+        return local.client
+
+    @classmethod
+    def reset(cls):
+        """Discard shared clients, e.g. after credentials change."""
+        cls._generation += 1
+
+    def rate_limit(self):
+        """Return (remaining calls, reset epoch) of the last call's endpoint or None."""
+        response = getattr(self.api, 'last_response', None)
+        headers = response.headers if response is not None else {}
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        if remaining is None or reset is None:
+            return None
+        return int(remaining), int(reset)
 
     @staticmethod
     def profile_url(id):
         return 'https://twitter.com/%s' % str(id)
 
-    def get_tweets(self, id, num=10):
-        try:
-            tweets = []
-            for t in tweepy.Cursor(self.api.user_timeline, id=id).items(num):
-                tweets.append(
-                    {
-                        'status_id': t.id_str,
-                        'text': t.text,
-                        'created': t.created_at,
-                        'user': t.user,
-                    }
-                )
-            return tweets
-        except tweepy.TweepError:
-            logger.exception('Error! Failed to get tweets.')
+    @staticmethod
+    def status_url(id, status_id):
+        return 'https://twitter.com/%s/status/%s' % (id, status_id)
+
+    def get_tweets(self, id, num=10, since_id=None, tweets=None):
+        """Return newest `num` tweets of `id`.
+
+        Pass previously fetched `tweets` and the newest `since_id` among
+        them to only download tweets posted since. Raises
+        `tweepy.RateLimitError` when out of calls and `tweepy.TweepError` on
+        other errors, e.g. if `id` doesn't exist.
+
+        """
+        kwargs = {'id': id, 'count': num}
+        if since_id:
+            kwargs['since_id'] = since_id
+        new = [
+            {
+                'status_id': t.id_str,
+                'text': t.text,
+                'created': t.created_at,
+                'img': t.user.profile_image_url,
+            }
+            for t in self.api.user_timeline(**kwargs)
+        ]
+        return (new + (tweets or []))[:num]
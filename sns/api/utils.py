@@ -1,120 +1,598 @@
 """Process data from API wrapper modules."""
 import logging
+import threading
+import time
 
-from .meetup import Meetup, OAuth2Code as MeetupOAuth
+from django.core.cache import cache
+from prawcore.exceptions import Forbidden, NotFound
+from tweepy import RateLimitError, TweepError
+
+from .records import Activity, epoch, Failure, PERMANENT, Status, TRANSIENT
+from .meetup import Meetup, MemberNotFound, OAuth2Code as MeetupOAuth
 from .spotify import Spotify, OAuth2Client as SpotifyOAuth
 from .twitter import Twitter
 from .reddit import Reddit
+from .transport import DeadlineExceeded, get_session
 
 logger = logging.getLogger(__name__)
 
+SPOTIFY_TOKEN_KEY = 'spotify:app_token'
+SPOTIFY_TOKEN_LOCK = 'spotify:app_token:lock'
+# Renew the shared app token this many seconds before it expires
+SPOTIFY_TOKEN_MARGIN = 60
+# Seconds to wait on another process renewing the app token
+SPOTIFY_TOKEN_WAIT = 5
+
+# Seconds before a shared Meetup activity feed is checked for newer items
+MEETUP_FEED_TTL = 60 * 10
+# Seconds a shared Meetup activity feed is kept to merge newer items into
+MEETUP_FEED_MAX_AGE = 60 * 60 * 24
+# Max activity items kept per Meetup member
+MEETUP_ACTIVITY_LIMIT = 10
+
+# Seconds fetched tweets are kept to merge newer tweets into
+TWITTER_TIMELINE_MAX_AGE = 60 * 60 * 24
+
+# Seconds to pause when Twitter rate limits without saying until when
+TWITTER_RATE_LIMIT_WINDOW = 15 * 60
+
+# Twitter API error codes of missing or suspended users
+TWITTER_MISSING_CODES = (34, 50, 63)
+
+# Failed fetches of a provider within the window that open its circuit
+BREAKER_FAILURES = 5
+BREAKER_WINDOW = 60
+# Seconds an open circuit fails fast before letting a probe through
+BREAKER_OPEN_FOR = 30
+# Seconds a probe may take before another one is let through
+BREAKER_PROBE_TIMEOUT = 30
+# Seconds an opened circuit is remembered without a successful probe
+BREAKER_MAX_AGE = 60 * 60 * 24
+
+_spotify_token = {}
+_spotify_token_lock = threading.Lock()
+
+
+def _token_expiring(token, margin=SPOTIFY_TOKEN_MARGIN):
+    return not token or time.time() > float(token.get('expires_at') or 0) - margin
+
+
+def spotify_app_token(deadline=None):
+    """Return the app-wide Spotify client credentials token.
+
+    The token isn't tied to a user, so one copy is kept in the cache for all
+    workers with an in-process copy in front. Shortly before it expires, the
+    process that takes the renewal lock fetches a new one; others keep using
+    the current token, or wait briefly if it has already expired.
+
+    """
+    global _spotify_token
+    if not _token_expiring(_spotify_token):
+        return _spotify_token
+
+    with _spotify_token_lock:
+        token = cache.get(SPOTIFY_TOKEN_KEY)
+        wait_until = time.monotonic() + SPOTIFY_TOKEN_WAIT
+        while _token_expiring(token):
+            if cache.add(SPOTIFY_TOKEN_LOCK, 1, 30):
+                try:
+                    logger.info('Renewing shared Spotify app token...')
+                    token = SpotifyOAuth(session=get_session(), deadline=deadline).token
+                    cache.set(
+                        SPOTIFY_TOKEN_KEY,
+                        token,
+                        max(int(token['expires_at'] - time.time()), 1),
+                    )
+                finally:
+                    cache.delete(SPOTIFY_TOKEN_LOCK)
+                break
+            if not _token_expiring(token, margin=0):
+                # Still valid while another process renews it
+                break
+            if time.monotonic() > wait_until:
+                raise TimeoutError('Timed out waiting on Spotify app token renewal.')
+            time.sleep(0.1)
+            token = cache.get(SPOTIFY_TOKEN_KEY)
+
+        _spotify_token = token
+    return token
+
+
+def meetup_token_expired(session):
+    """Return whether `session` holds an expired Meetup token."""
+    token = session.get('meetup_token')
+    return bool(token) and MeetupOAuth(token=token).is_token_expired()
+
+
+def refresh_meetup_token(session):
+    """Return auth of `session`'s Meetup token, refreshing it if expired.
+
+    The refreshed token is written to `session`, so it must be the session
+    saved with the response; a copy would lose it.
+
+    """
+    auth = MeetupOAuth(token=session['meetup_token'])
+    if auth.is_token_expired():
+        logger.info('Meetup token expired. Refreshing...')
+        session['meetup_token'] = auth.refresh_token()
+        logger.debug('New Meetup token: %s', session.get('meetup_token'))
+    return auth
+
+
+def meetup_feed(meetup, owner, member_id):
+    """Return group activity visible to Meetup member `owner`, indexed by member.
+
+    The feed covers every group the token owner belongs to, so one crawl
+    serves all Meetup profiles looked up with that owner's token. Once older
+    than `MEETUP_FEED_TTL`, only pages newer than the newest known item are
+    crawled and merged in. A crawl for `member_id` stops as soon as
+    `MEETUP_ACTIVITY_LIMIT` of their items are found; other members missing
+    from such a partial feed trigger their own crawl. A crawl cut short by
+    `meetup`'s deadline is retried by the next call.
+
+    """
+    key = 'meetup:feed:%s' % owner
+    member_id = str(member_id)
+    feed = cache.get(key) or {
+        'index': {},
+        'watermark': None,
+        'fetched_at': 0,
+        'complete': False,
+    }
+    changed = False
+
+    if feed['watermark'] and time.time() - feed['fetched_at'] > MEETUP_FEED_TTL:
+        logger.info('Crawling new Meetup activity of %s', owner)
+        data = meetup.get_activity(since=feed['watermark'])
+        if meetup.truncated:
+            # Older new items would be skipped once the watermark moves past them
+            logger.warning('Serving Meetup activity of %s without new items.', owner)
+        else:
+            feed['index'] = meetup.merge_activity(
+                feed['index'], data, MEETUP_ACTIVITY_LIMIT
+            )
+            feed['fetched_at'] = time.time()
+            changed = True
+
+    if (
+        not feed['complete']
+        and len(feed['index'].get(member_id, [])) < MEETUP_ACTIVITY_LIMIT
+    ):
+        logger.info('Crawling Meetup activity of %s for %s', owner, member_id)
+        data = meetup.get_activity(member_id=member_id, limit=MEETUP_ACTIVITY_LIMIT)
+        feed['index'] = meetup.merge_activity(
+            feed['index'], data, MEETUP_ACTIVITY_LIMIT
+        )
+        # Stopping short of the limit means the whole feed was crawled
+        found = sum(1 for d in data if d.get('member_id') == member_id)
+        feed['complete'] = found < MEETUP_ACTIVITY_LIMIT and not meetup.truncated
+        feed['fetched_at'] = feed['fetched_at'] or time.time()
+        changed = True
+
+    if changed:
+        created = [
+            a['created']
+            for activity in feed['index'].values()
+            for a in activity
+            if a.get('created')
+        ]
+        feed['watermark'] = max(created, default=feed['watermark'])
+        cache.set(key, feed, MEETUP_FEED_MAX_AGE)
+    return feed['index']
+
+
+def twitter_budget(endpoint):
+    """Return (remaining calls, reset epoch) last reported for Twitter `endpoint`.
+
+    Shared by all workers; None if unknown or the window has reset.
+
+    """
+    return cache.get('twitter:budget:%s' % endpoint)
+
+
+def twitter_paused_until(endpoint):
+    """Return epoch until which `endpoint`'s budget is spent, or None."""
+    budget = twitter_budget(endpoint)
+    if budget and budget[0] <= 0 and budget[1] > time.time():
+        return budget[1]
+    return None
+
+
+def record_twitter_budget(endpoint, budget):
+    """Store `budget` (remaining calls, reset epoch) of `endpoint` until it resets."""
+    cache.set(
+        'twitter:budget:%s' % endpoint, budget, max(int(budget[1] - time.time()), 1)
+    )
+
+
+class AccountNotFound(LookupError):
+    """Raised when an account doesn't exist on its provider."""
+
+
+def failure(exc):
+    """Return the `Failure` marker of fetch error `exc`.
+
+    Errors saying the account doesn't exist, is suspended or is private are
+    permanent; anything else is taken to be transient. Twitter answers 401
+    both for protected timelines and for a bad app token; only the former
+    comes without an error code.
+
+    """
+    permanent = isinstance(
+        exc, (AccountNotFound, MemberNotFound, NotFound, Forbidden)
+    ) or (
+        isinstance(exc, TweepError)
+        and (
+            exc.api_code in TWITTER_MISSING_CODES
+            or (
+                exc.api_code is None
+                and getattr(exc.response, 'status_code', None) in (401, 404)
+            )
+        )
+    )
+    return Failure(PERMANENT if permanent else TRANSIENT, type(exc).__name__)
+
+
+def failed(breaker, exc):
+    """Return the `Failure` of `exc`, counting transient ones against `breaker`.
+
+    Running out of our own deadline says nothing about the provider, so it
+    isn't counted either way.
+
+    """
+    marker = failure(exc)
+    if isinstance(exc, DeadlineExceeded):
+        breaker.abandon()
+    elif marker.kind == TRANSIENT:
+        breaker.failure()
+    else:
+        # The provider answered
+        breaker.success()
+    return marker
+
+
+class CircuitBreaker:
+    """Fail fast on a provider that keeps failing, in all workers.
+
+        >>> breaker = CircuitBreaker('spotify')
+        >>> if breaker.allow():
+        ...     try:
+        ...         fetch()
+        ...     except Exception:
+        ...         breaker.failure()
+        ...     else:
+        ...         breaker.success()
+
+    `BREAKER_FAILURES` failures within `BREAKER_WINDOW` seconds open the
+    circuit: calls aren't allowed for `BREAKER_OPEN_FOR` seconds. It is then
+    half-open: a single call is let through as a probe, which closes the
+    circuit if it succeeds or opens it again if it fails. State is kept in
+    the cache, shared by all workers.
+
+    """
+
+    def __init__(self, sns):
+        self.sns = sns
+        # Whether the allowed call is the half-open probe
+        self.probing = False
+
+    @staticmethod
+    def keys(sns):
+        """Return keys of (failure count, open until, opened, probe) of `sns`."""
+        return [
+            'breaker:%s:%s' % (sns, k) for k in ('failures', 'open', 'opened', 'probe')
+        ]
+
+    @classmethod
+    def state(cls, sns):
+        """Return {'state', 'failures', 'open_until'} of `sns`'s circuit."""
+        failures, open_, opened, _ = cls.keys(sns)
+        values = cache.get_many([failures, open_, opened])
+        if open_ in values:
+            state = 'open'
+        elif opened in values:
+            state = 'half-open'
+        else:
+            state = 'closed'
+        return {
+            'state': state,
+            'failures': values.get(failures, 0),
+            'open_until': values.get(open_),
+        }
+
+    def allow(self):
+        """Return whether a call may be made now."""
+        _, open_, opened, probe = self.keys(self.sns)
+        values = cache.get_many([open_, opened])
+        if open_ in values:
+            return False
+        if opened in values:
+            self.probing = cache.add(probe, 1, BREAKER_PROBE_TIMEOUT)
+            return self.probing
+        return True
+
+    def success(self):
+        """Record a successful call, closing the circuit after a probe."""
+        if self.probing:
+            logger.info('Closing %s circuit.', self.sns)
+            cache.delete_many(self.keys(self.sns))
+            self.probing = False
+
+    def abandon(self):
+        """Record an allowed call that wasn't made or judged, freeing the probe."""
+        if self.probing:
+            cache.delete(self.keys(self.sns)[3])
+            self.probing = False
+
+    def failure(self):
+        """Record a failed call, opening the circuit if there were too many."""
+        failures = self.keys(self.sns)[0]
+        if self.probing:
+            self.probing = False
+            self._open()
+            return
+        try:
+            count = cache.incr(failures)
+        except ValueError:
+            # First failure in this window
+            if cache.add(failures, 1, BREAKER_WINDOW):
+                count = 1
+            else:
+                count = cache.incr(failures)
+        if count >= BREAKER_FAILURES:
+            self._open()
+
+    def _open(self):
+        logger.warning('Opening %s circuit for %ss.', self.sns, BREAKER_OPEN_FOR)
+        failures, open_, opened, probe = self.keys(self.sns)
+        cache.set(open_, int(time.time()) + BREAKER_OPEN_FOR, BREAKER_OPEN_FOR)
+        cache.set(opened, 1, BREAKER_MAX_AGE)
+        cache.delete_many([failures, probe])
+
 
 class GetActivity:
-    """Return activity data and process OAuth tokens in session."""
+    """Return activity data and process OAuth tokens in session.
+
+    Pass a `deadline` (see `api.transport.Deadline`) to bound the time spent
+    on upstream calls; the shared Reddit and Twitter clients keep their own
+    timeouts. Failed fetches return a `Failure` marker instead of activity;
+    providers whose `CircuitBreaker` is open return a transient one at once.
+
+    """
+
+    @staticmethod
+    def profile_url(sns, id):
+        """Return URL of `id`'s profile on `sns` without calling its API."""
+        return {
+            'meetup': Meetup.profile_url,
+            'reddit': Reddit.profile_url,
+            'spotify': lambda id: 'https://open.spotify.com/user/%s' % str(id),
+            'twitter': Twitter.profile_url,
+        }[sns](id)
 
     @staticmethod
-    def meetup(request, id):
+    def meetup(request, id, deadline=None):
         if request.session.get('meetup_token'):
+            if deadline and deadline.expired:
+                # E.g. queued too long; not the provider's fault
+                logger.warning('No time left to fetch Meetup data.')
+                return request, Failure(TRANSIENT, 'DeadlineExceeded')
+            breaker = CircuitBreaker('meetup')
+            if not breaker.allow():
+                logger.warning('Meetup circuit open. Skipping data fetch')
+                return request, Failure(TRANSIENT, 'CircuitOpen')
             # Try to reuse stored token
             logger.info('Trying to reuse stored Meetup token...')
-            auth = MeetupOAuth(token=request.session['meetup_token'])
-            if auth.is_token_expired():
-                logger.info('Meetup token expired. Refreshing...')
-                request.session['meetup_token'] = auth.refresh_token()
-                logger.debug(
-                    'New Meetup token: %s', request.session.get('meetup_token')
-                )
+            auth = refresh_meetup_token(request.session)
             try:
                 logger.info('Fetching Meetup data')
-                meetup = Meetup(auth)
-                data = {
-                    'user': {
-                        'url': meetup.profile_url(id),
-                        'img': meetup.get_member_photo(id),
-                    },
-                    'statuses': meetup.user_activity(id),
-                }
+                meetup = Meetup(auth, session=get_session(), deadline=deadline)
+                if not request.session.get('meetup_member_id'):
+                    # Owner of the token, whose groups make up the feed
+                    owner = meetup.get_member() or {}
+                    request.session['meetup_member_id'] = owner.get('id')
+                owner = request.session['meetup_member_id']
+                activity = meetup.user_activity(
+                    id, index=meetup_feed(meetup, owner, id) if owner else None
+                )
+                if meetup.truncated and not activity:
+                    logger.warning('Meetup crawl found nothing before the deadline.')
+                    return request, Failure(TRANSIENT, 'DeadlineExceeded')
+                img = ''
+                if not (deadline and deadline.expired):
+                    # Else serve what the crawl found rather than fail on it
+                    img = meetup.get_member_photo(id) or ''
+                data = Activity(
+                    url=meetup.profile_url(id),
+                    img=img,
+                    statuses=[
+                        Status(
+                            title=a.get('title') or '',
+                            url=a.get('link') or '',
+                            img=a.get('photo_url') or '',
+                            created=epoch(a.get('created')),
+                            context=a.get('rsvp_response') or '',
+                            # Activity has no ID of its own
+                            id='%s:%s' % (a.get('published'), a.get('link')),
+                        )
+                        for a in activity or ()
+                    ],
+                    partial=meetup.truncated,
+                )
                 logger.debug('Meetup data: %s', data)
+                breaker.success()
                 return request, data
-            except Exception:
+            except Exception as e:
                 logger.exception('Failed to fetch data from Meetup API.')
+                return request, failed(breaker, e)
 
         logger.warning('No Meetup token in request. Skipping data fetch')
         return request, None
 
     @staticmethod
-    def spotify(request, id):
+    def spotify(request, id, deadline=None):
         """Return user's playlist information"""
+        if deadline and deadline.expired:
+            # E.g. queued too long; not the provider's fault
+            logger.warning('No time left to fetch Spotify data.')
+            return request, Failure(TRANSIENT, 'DeadlineExceeded')
+        breaker = CircuitBreaker('spotify')
+        if not breaker.allow():
+            logger.warning('Spotify circuit open. Skipping data fetch')
+            return request, Failure(TRANSIENT, 'CircuitOpen')
         try:
-            if request.session.get(
-                'spotify_token'
-            ) and not SpotifyOAuth().is_token_expired(request.session['spotify_token']):
-                # Reuse stored token
-                spotify = Spotify(
-                    auth=SpotifyOAuth(token=request.session['spotify_token'])
-                )
-            else:
-                spotify = Spotify()
-                request.session['spotify_token'] = spotify.auth.token
+            # Client credentials are app-wide; share one token between sessions
+            spotify = Spotify(
+                auth=SpotifyOAuth(token=spotify_app_token(deadline)),
+                session=get_session(),
+                deadline=deadline,
+            )
 
-            playlists = spotify.get_playlists(id).get('items')
+            response = spotify.get_playlists(id)
+            error = response.get('error')
+            if error:
+                if error.get('status') == 404:
+                    raise AccountNotFound(id)
+                raise RuntimeError('Spotify error: %s' % error)
+            playlists = response.get('items')
             user = playlists[0].get('owner') if playlists else {}
             images = user.get('images') if user else []
             urls = user.get('external_urls') if user else {}
-            data = {
-                'user': {
-                    'url': urls.get('spotify')
-                    if urls
-                    else 'https://open.spotify.com/user/%s' % str(id),
-                    # Make another fetch for photo data as last resort
-                    'img': images[0].get('url')
-                    if images
-                    else (spotify.profile_image_url(id) or ''),
-                },
-                'statuses': playlists,
-            }
+            data = Activity(
+                url=urls.get('spotify')
+                if urls
+                else 'https://open.spotify.com/user/%s' % str(id),
+                # Make another fetch for photo data as last resort
+                img=images[0].get('url')
+                if images
+                else (spotify.profile_image_url(id) or ''),
+                statuses=[
+                    Status(
+                        title=p.get('name') or '',
+                        url=(p.get('external_urls') or {}).get('spotify') or '',
+                        img=p['images'][0].get('url') if p.get('images') else '',
+                        id=p.get('id') or '',
+                    )
+                    for p in playlists or ()
+                ],
+            )
+            breaker.success()
             return request, data
 
-        except Exception:
+        except Exception as e:
             logger.exception('Failed to fetch data from Spotify API.')
-            return request, None
+            return request, failed(breaker, e)
 
     @staticmethod
-    def reddit(request, username):
+    def reddit(request, username, deadline=None):
         """Return latest Reddit activity"""
+        if deadline and deadline.expired:
+            # E.g. queued too long; not the provider's fault
+            logger.warning('No time left to fetch Reddit data.')
+            return request, Failure(TRANSIENT, 'DeadlineExceeded')
+        breaker = CircuitBreaker('reddit')
+        if not breaker.allow():
+            logger.warning('Reddit circuit open. Skipping data fetch')
+            return request, Failure(TRANSIENT, 'CircuitOpen')
         try:
             logger.info('Fetching Reddit data')
-            reddit = Reddit()
-            data = {
-                'user': {
-                    'url': reddit.profile_url(username),
-                    'img': reddit.profile_image_url(username) or '',
-                },
-                'statuses': reddit.get_comments_submissions(username),
-            }
+            reddit = Reddit.shared()
+            # One overview request plus one for the avatar
+            redditor = reddit.api.redditor(username)
+            data = Activity(
+                url=reddit.profile_url(username),
+                img=reddit.profile_image_url(username, redditor) or '',
+                statuses=[
+                    Status(
+                        title=s['title'],
+                        text=s['text'] or '',
+                        url=s['url'],
+                        created=epoch(s['created']),
+                        context=s['subreddit'],
+                        id=s['id'],
+                    )
+                    for s in reddit.get_comments_submissions(
+                        username, redditor=redditor
+                    )
+                ],
+            )
             logger.debug('Reddit data: %s', data)
+            breaker.success()
             return request, data
-        except Exception:
+        except Exception as e:
             logger.exception('Failed to fetch data from Reddit API.')
-            return request, None
+            return request, failed(breaker, e)
 
     @staticmethod
-    def twitter(request, id):
+    def twitter(request, id, deadline=None):
         """Return latest tweets"""
+        if deadline and deadline.expired:
+            # E.g. queued too long; not the provider's fault
+            logger.warning('No time left to fetch Twitter data.')
+            return request, Failure(TRANSIENT, 'DeadlineExceeded')
+        breaker = CircuitBreaker('twitter')
+        if not breaker.allow():
+            logger.warning('Twitter circuit open. Skipping data fetch')
+            return request, Failure(TRANSIENT, 'CircuitOpen')
         try:
             logger.info('Fetching Twitter data')
-            twitter = Twitter()
-            statuses = twitter.get_tweets(id=id, num=5)
-            user = statuses[0].get('user') if statuses else None
-            data = {
-                'user': {
-                    'url': twitter.profile_url(id),
-                    'img': user.profile_image_url if user else '',
-                },
-                'statuses': statuses,
-            }
+            twitter = Twitter.shared()
+            # Only download tweets newer than the ones already fetched
+            key = 'twitter:timeline:%s' % id
+            timeline = cache.get(key) or {}
+            paused_until = twitter_paused_until(Twitter.TIMELINE)
+            if not paused_until:
+                try:
+                    statuses = twitter.get_tweets(
+                        id=id,
+                        num=5,
+                        since_id=timeline.get('since_id'),
+                        tweets=timeline.get('tweets'),
+                    )
+                except RateLimitError:
+                    logger.warning('Twitter rate limit hit.')
+                    _, paused_until = twitter.rate_limit() or (
+                        0,
+                        int(time.time()) + TWITTER_RATE_LIMIT_WINDOW,
+                    )
+                    record_twitter_budget(Twitter.TIMELINE, (0, paused_until))
+                else:
+                    budget = twitter.rate_limit()
+                    if budget:
+                        record_twitter_budget(Twitter.TIMELINE, budget)
+
+            if paused_until:
+                if not timeline:
+                    logger.warning('Twitter paused until %s.', paused_until)
+                    return request, Failure(TRANSIENT, 'RateLimited')
+                logger.warning(
+                    'Twitter paused until %s. Serving last fetched tweets.', paused_until
+                )
+                statuses = timeline.get('tweets') or []
+            else:
+                since_id = statuses[0]['status_id'] if statuses else None
+                cache.set(
+                    key,
+                    {'since_id': since_id, 'tweets': statuses},
+                    TWITTER_TIMELINE_MAX_AGE,
+                )
+            data = Activity(
+                url=twitter.profile_url(id),
+                img=(statuses[0].get('img') or '') if statuses else '',
+                statuses=[
+                    Status(
+                        text=t['text'],
+                        url=Twitter.status_url(id, t['status_id']),
+                        created=epoch(t['created']),
+                        id=t['status_id'],
+                    )
+                    for t in statuses
+                ],
+                paused_until=paused_until,
+            )
             logger.debug('Twitter data: %s', data)
+            breaker.success()
             return request, data
-        except Exception:
+        except Exception as e:
             logger.exception('Failed to fetch data from Twitter API.')
-            return request, None
+            return request, failed(breaker, e)
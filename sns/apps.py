@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class SnsConfig(AppConfig):
     name = 'sns'
+
+    def ready(self):
+        # Connects the profile receivers
+        from . import signals
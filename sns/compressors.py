@@ -0,0 +1,50 @@
+"""Cache value compression for the django-redis backend.
+
+Enabled through the `COMPRESSOR` option of `CACHES` in settings.
+
+"""
+import time
+import zlib
+
+from django_redis.compressors.zlib import ZlibCompressor
+
+from . import metrics
+
+
+class MeteredZlibCompressor(ZlibCompressor):
+    """Compress values longer than `COMPRESS_MIN_LENGTH` bytes with zlib.
+
+    Shorter values are stored as is; reading them falls through
+    `decompress`'s error like with `ZlibCompressor`. Bytes in and out and
+    CPU time spent are counted in `compression:*` metrics, e.g. to tune the
+    threshold from the compression ratio (bytes_out / bytes_in).
+
+    """
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.min_length = options.get('COMPRESS_MIN_LENGTH', 1024)
+        self.preset = options.get('COMPRESS_LEVEL', self.preset)
+        self.metrics = metrics.Buffer('compression:')
+
+    def compress(self, value):
+        if len(value) <= self.min_length:
+            return value
+        start = time.thread_time()
+        compressed = zlib.compress(value, self.preset)
+        self.metrics.add(
+            compressed=1,
+            bytes_in=len(value),
+            bytes_out=len(compressed),
+            compress_us=int((time.thread_time() - start) * 1e6),
+        )
+        return compressed
+
+    def decompress(self, value):
+        start = time.thread_time()
+        value = super().decompress(value)
+        self.metrics.add(
+            decompressed=1,
+            decompress_us=int((time.thread_time() - start) * 1e6),
+        )
+        return value
@@ -0,0 +1,91 @@
+"""Queue of profile refreshes drained by `manage.py refresh_worker`.
+
+    >>> enqueue_refresh(profile, request.session)  # Returns at once
+    True
+    >>> enqueue_refresh(profile, request.session)  # Already queued
+    False
+    >>> enqueue_refresh(profile, request.session, 'twitter')  # Only one card
+    True
+
+"""
+from concurrent.futures import wait
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from . import local_cache
+from .activity import activity_keys, get_executor, revalidate
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'refresh:queue'
+# Session keys needed to fetch on behalf of the visitor asking for a refresh
+SESSION_KEYS = ('meetup_token', 'meetup_member_id')
+
+
+def queued_key(pk, sns=None):
+    """Return key marking a refresh of profile `pk` (or just its `sns` card)
+    as queued or running."""
+    if sns:
+        return 'refresh:queued:%s:%s' % (pk, sns)
+    return 'refresh:queued:%s' % pk
+
+
+def refreshing(profile):
+    """Return providers of `profile` with a refresh queued or running."""
+    fields = [sns for sns, acct in profile.get_fields() if acct]
+    markers = cache.get_many(
+        [queued_key(profile.pk), *(queued_key(profile.pk, sns) for sns in fields)]
+    )
+    if queued_key(profile.pk) in markers:
+        return fields
+    return [sns for sns in fields if queued_key(profile.pk, sns) in markers]
+
+
+def enqueue_refresh(profile, session, sns=None):
+    """Queue a refresh of `profile`, or only its `sns` account, unless one is
+    pending. Return whether it was queued.
+
+    The marker is kept until the job has run, so repeated requests while a
+    refresh is queued or running are dropped.
+
+    """
+    key = queued_key(profile.pk, sns)
+    if not cache.add(key, 1, settings.ACTIVITY_REFRESH_JOB_TIMEOUT):
+        return False
+    job = {
+        'pk': profile.pk,
+        'sns': sns,
+        'session': {k: session[k] for k in SESSION_KEYS if session.get(k)},
+    }
+    get_redis_connection('default').rpush(QUEUE_KEY, json.dumps(job))
+    return True
+
+
+def pop(timeout):
+    """Return next job, waiting up to `timeout` seconds, or None."""
+    item = get_redis_connection('default').blpop(QUEUE_KEY, timeout)
+    return json.loads(item[1]) if item else None
+
+
+def run(job):
+    """Refetch and cache activity of the job's profile, or only of its
+    account on the job's provider."""
+    try:
+        profile = Profile.objects.filter(pk=job['pk']).first()
+        if profile is None:
+            return
+        accounts = activity_keys(profile, job.get('sns'))
+        futures = [
+            get_executor().submit(revalidate, job['session'], key, *account)
+            for key, account in accounts.items()
+        ]
+        wait(futures)
+        # Other processes may hold the replaced entries locally
+        local_cache.invalidate(accounts)
+    finally:
+        cache.delete(queued_key(job['pk'], job.get('sns')))
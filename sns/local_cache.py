@@ -0,0 +1,137 @@
+"""Per-process LRU of activity entries in front of the shared cache.
+
+Entries are kept for `ACTIVITY_LOCAL_TTL` seconds at most. Invalidations are
+published on a Redis channel so every worker process drops its copies.
+
+    >>> local = get_local()
+    >>> local.set_many({'activity:reddit:joe': '[...]'})
+    >>> invalidate(['activity:reddit:joe'])  # In all processes
+
+"""
+from collections import OrderedDict
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'activity:invalidate'
+# Seconds to wait for messages before checking the connection again
+LISTEN_TIMEOUT = 1
+# Seconds to wait before resubscribing after losing the connection
+RESUBSCRIBE_INTERVAL = 5
+
+_local = None
+_local_pid = None
+_local_lock = threading.Lock()
+
+
+class LocalCache:
+    """Thread-safe LRU of string values bounded by count, total length and age."""
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # {key: (value, expires at)}, least recently used first
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_many(self, keys):
+        """Return {key: value} of unexpired `keys`, marking them recently used."""
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None:
+                    continue
+                if item[1] <= now:
+                    self._pop(key)
+                    continue
+                self._data.move_to_end(key)
+                found[key] = item[0]
+        return found
+
+    def set_many(self, data):
+        """Store `data` ({key: str}), evicting least recently used entries."""
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in data.items():
+                self._pop(key)
+                if len(value) > self.max_bytes:
+                    continue
+                self._data[key] = (value, expires)
+                self._bytes += len(value)
+            while self._data and (
+                len(self._data) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self._data)))
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[0])
+
+
+def get_local():
+    """Return this process's `LocalCache`, listening for invalidations."""
+    global _local, _local_pid
+    with _local_lock:
+        # Threads don't survive a fork
+        if _local is None or _local_pid != os.getpid():
+            _local = LocalCache(
+                settings.ACTIVITY_LOCAL_MAX_ENTRIES,
+                settings.ACTIVITY_LOCAL_MAX_BYTES,
+                settings.ACTIVITY_LOCAL_TTL,
+            )
+            _local_pid = os.getpid()
+            threading.Thread(
+                target=_listen, args=(_local,), name='local-cache', daemon=True
+            ).start()
+        return _local
+
+
+def invalidate(keys):
+    """Drop `keys` from the local caches of all processes."""
+    keys = list(keys)
+    get_local().delete_many(keys)
+    get_redis_connection('default').publish(INVALIDATION_CHANNEL, json.dumps(keys))
+
+
+def _listen(local):
+    """Drop keys published on the invalidation channel from `local`, forever."""
+    while True:
+        try:
+            pubsub = get_redis_connection('default').pubsub(
+                ignore_subscribe_messages=True
+            )
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            while True:
+                message = pubsub.get_message(timeout=LISTEN_TIMEOUT)
+                if message:
+                    local.delete_many(json.loads(message['data']))
+        except Exception:
+            logger.exception('Lost local cache invalidation channel.')
+            # Invalidations may have been missed while disconnected
+            local.clear()
+            time.sleep(RESUBSCRIBE_INTERVAL)
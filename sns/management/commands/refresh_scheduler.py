@@ -0,0 +1,183 @@
+"""Keep activity of recently viewed profiles warm in the cache."""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from sns.activity import (
+    activity_keys,
+    cache_ttl,
+    decode_entry,
+    recent_views,
+    revalidate,
+)
+from sns.models import Profile
+
+# Approximate upstream API calls made by one refresh of each provider
+UPSTREAM_CALLS = {'reddit': 2, 'spotify': 1, 'twitter': 1}
+# Max keys read from the cache at once while planning
+BATCH_SIZE = 500
+
+# Entries with the lowest `priority` are refreshed first once `due`
+Refresh = namedtuple('Refresh', 'priority due views key sns acct')
+
+
+def plan(now=None):
+    """Return heap of `Refresh`es of entries of recently viewed profiles.
+
+    An entry is due `ACTIVITY_REFRESH_LEAD` seconds before it goes stale, or
+    right away if it isn't cached. Each recent view of any profile listing
+    its account moves its priority `ACTIVITY_REFRESH_VIEW_WEIGHT` seconds
+    ahead.
+
+    """
+    now = now or time.time()
+    profiles = list(Profile.objects.all())
+    views = recent_views([p.pk for p in profiles])
+    accounts = {}
+    account_views = {}
+    for profile in profiles:
+        if views[profile.pk] < settings.ACTIVITY_REFRESH_MIN_VIEWS:
+            continue
+        for key, (sns, acct) in activity_keys(profile).items():
+            if sns in settings.ACTIVITY_REFRESH_CONCURRENCY:
+                accounts[key] = (sns, acct)
+                account_views[key] = account_views.get(key, 0) + views[profile.pk]
+
+    keys = list(accounts)
+    heap = []
+    for i in range(0, len(keys), BATCH_SIZE):
+        cached = cache.get_many(keys[i : i + BATCH_SIZE])
+        for key in keys[i : i + BATCH_SIZE]:
+            entry = decode_entry(cached.get(key))
+            due = entry[1] - settings.ACTIVITY_REFRESH_LEAD if entry else now
+            priority = due - account_views[key] * settings.ACTIVITY_REFRESH_VIEW_WEIGHT
+            heapq.heappush(
+                heap, Refresh(priority, due, account_views[key], key, *accounts[key])
+            )
+    return heap
+
+
+def calls_per_minute(heap):
+    """Return upstream calls per minute expected to keep `heap`'s entries warm."""
+    return sum(UPSTREAM_CALLS.get(r.sns, 1) * 60 / cache_ttl(r.sns)[0] for r in heap)
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresh cached activity of recently viewed profiles before it goes '
+        'stale, most stale and popular first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Print the planned schedule and expected upstream calls, then exit.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=15,
+            help='Seconds between scans of profiles (default: 15).',
+        )
+        parser.add_argument(
+            '--once', action='store_true', help='Scan and refresh once, then exit.'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.print_plan(plan())
+            return
+
+        limits = settings.ACTIVITY_REFRESH_CONCURRENCY
+        self.prepare(
+            ThreadPoolExecutor(
+                max_workers=sum(limits.values()), thread_name_prefix='refresh'
+            )
+        )
+        try:
+            while True:
+                self.tick(plan())
+                if options['once']:
+                    self.join()
+                    break
+                time.sleep(options['interval'])
+        finally:
+            with self.lock:
+                for pending in self.pending.values():
+                    pending.clear()
+            self.executor.shutdown(wait=True)
+
+    def prepare(self, executor):
+        """Set up per-provider queues and slots for refreshes run by `executor`."""
+        limits = settings.ACTIVITY_REFRESH_CONCURRENCY
+        self.executor = executor
+        # Due refreshes waiting for a slot of their provider, by priority
+        self.pending = {sns: [] for sns in limits}
+        self.slots = {sns: threading.BoundedSemaphore(n) for sns, n in limits.items()}
+        # Keys pending or running
+        self.queued = set()
+        self.lock = threading.Condition()
+
+    def tick(self, heap):
+        """Queue due refreshes of `heap` and start as many as limits allow.
+
+        Refreshes that find their provider at its limit stay queued and are
+        started as earlier ones finish.
+
+        """
+        now = time.time()
+        with self.lock:
+            for refresh in heap:
+                if refresh.due <= now and refresh.key not in self.queued:
+                    self.queued.add(refresh.key)
+                    heapq.heappush(self.pending[refresh.sns], refresh)
+        for sns in self.pending:
+            self.drain(sns)
+
+    def drain(self, sns):
+        """Submit queued refreshes of `sns` while it has free slots."""
+        while True:
+            with self.lock:
+                if not self.pending[sns] or not self.slots[sns].acquire(False):
+                    return
+                refresh = heapq.heappop(self.pending[sns])
+            future = self.executor.submit(
+                revalidate, {}, refresh.key, refresh.sns, refresh.acct
+            )
+            future.add_done_callback(self.done(refresh))
+
+    def done(self, refresh):
+        """Return callback freeing `refresh`'s slot and starting the next one."""
+
+        def callback(future):
+            with self.lock:
+                self.queued.discard(refresh.key)
+                self.slots[refresh.sns].release()
+                self.lock.notify_all()
+            self.drain(refresh.sns)
+
+        return callback
+
+    def join(self):
+        """Wait until all queued refreshes have run."""
+        with self.lock:
+            self.lock.wait_for(lambda: not self.queued)
+
+    def print_plan(self, heap):
+        now = time.time()
+        self.stdout.write('%8s %6s  %s' % ('due in', 'views', 'key'))
+        for refresh in sorted(heap):
+            self.stdout.write(
+                '%7ds %6d  %s' % (refresh.due - now, refresh.views, refresh.key)
+            )
+        self.stdout.write(
+            '%d entries kept warm, ~%.1f upstream calls per minute.'
+            % (len(heap), calls_per_minute(heap))
+        )
@@ -0,0 +1,30 @@
+"""Run profile refreshes queued by the `refresh_activity` view."""
+import logging
+
+from django.core.management.base import BaseCommand
+
+from sns import jobs
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run queued profile refreshes, one at a time, forever.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', help='Exit once the queue is empty.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            job = jobs.pop(timeout=5)
+            if job is None:
+                if options['once']:
+                    return
+                continue
+            logger.info('Refreshing profile %s.', job['pk'])
+            try:
+                jobs.run(job)
+            except Exception:
+                logger.exception('Failed to refresh profile %s.', job['pk'])
@@ -0,0 +1,66 @@
+"""Counters shared by all worker processes, kept in the default cache."""
+import threading
+import time
+
+from django.core.cache import cache
+
+# Seconds between flushes of a `Buffer`
+FLUSH_INTERVAL = 10
+
+
+def _key(name):
+    return 'metrics:%s' % name
+
+
+def incr(name, delta=1):
+    """Increase counter `name` by `delta`."""
+    key = _key(name)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Counter doesn't exist yet. `add` won't clobber a concurrent first hit.
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def get(*names):
+    """Return {name: value} of counters `names` (0 if never incremented)."""
+    values = cache.get_many([_key(name) for name in names])
+    return {name: values.get(_key(name), 0) for name in names}
+
+
+def reset(*names):
+    """Delete counters `names`."""
+    cache.delete_many([_key(name) for name in names])
+
+
+class Buffer:
+    """Counters summed in-process and flushed every `FLUSH_INTERVAL` seconds.
+
+    For hot paths where a round-trip per increment would cost more than the
+    work being counted.
+
+    """
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def add(self, **deltas):
+        """Add `deltas` ({name: delta}) to the counters."""
+        with self._lock:
+            for name, delta in deltas.items():
+                self.counts[name] = self.counts.get(name, 0) + delta
+            if time.monotonic() - self._flushed_at < FLUSH_INTERVAL:
+                return
+        self.flush()
+
+    def flush(self):
+        """Add counts so far to the shared counters."""
+        with self._lock:
+            counts, self.counts = self.counts, {}
+            self._flushed_at = time.monotonic()
+        for name, delta in counts.items():
+            incr(self.prefix + name, delta)
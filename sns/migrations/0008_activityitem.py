@@ -0,0 +1,36 @@
+# Generated by Django 3.1.6 on 2026-10-18 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sns', '0007_remove_profile_line'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=10)),
+                ('account', models.CharField(max_length=30)),
+                ('external_id', models.CharField(max_length=255)),
+                ('title', models.TextField(blank=True)),
+                ('text', models.TextField(blank=True)),
+                ('url', models.TextField(blank=True)),
+                ('img', models.TextField(blank=True)),
+                ('context', models.CharField(blank=True, max_length=255)),
+                ('created', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='activityitem',
+            index=models.Index(fields=['provider', 'account', '-created'], name='activity_newest'),
+        ),
+        migrations.AddConstraint(
+            model_name='activityitem',
+            constraint=models.UniqueConstraint(fields=('provider', 'account', 'external_id'), name='unique_activity_item'),
+        ),
+    ]
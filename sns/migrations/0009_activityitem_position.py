@@ -0,0 +1,18 @@
+# Generated by Django 3.1.6 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sns', '0008_activityitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activityitem',
+            name='position',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
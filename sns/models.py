@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import connection, models
+from django.db.models import F
 from django.urls import reverse
 
 
@@ -25,3 +26,81 @@ class Profile(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class ActivityItemManager(models.Manager):
+    def newest(self, provider, account, limit):
+        """Return newest `limit` items of `account` on `provider`."""
+        return self.filter(provider=provider, account=account).order_by(
+            F('created').desc(nulls_last=True), 'position'
+        )[:limit]
+
+    def replace(self, provider, account, items):
+        """Make unsaved `items` the only items of `account` on `provider`.
+
+        Items are upserted on their external ID in a single statement, so
+        unchanged rows keep their primary key.
+
+        """
+        # A row can only be upserted once per statement
+        items = list({item.external_id: item for item in reversed(items)}.values())
+        if items:
+            names = ('provider', 'account', 'external_id') + ActivityItem.CONTENT
+            fields = [ActivityItem._meta.get_field(name) for name in names]
+            columns = [f.column for f in fields]
+            row = '(%s)' % ', '.join(['%s'] * len(fields))
+            # `bulk_create` can't update rows on conflict before Django 4.1
+            sql = 'INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) DO UPDATE SET %s' % (
+                ActivityItem._meta.db_table,
+                ', '.join(columns),
+                ', '.join([row] * len(items)),
+                ', '.join(columns[:3]),
+                ', '.join('%s = EXCLUDED.%s' % (c, c) for c in columns[3:]),
+            )
+            params = [
+                f.get_db_prep_save(getattr(item, f.attname), connection)
+                for item in items
+                for f in fields
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+        self.filter(provider=provider, account=account).exclude(
+            external_id__in=[item.external_id for item in items]
+        ).delete()
+
+
+class ActivityItem(models.Model):
+    """A status last fetched for an account, shared by all profiles listing it."""
+
+    # Fields updated when an item is fetched again
+    CONTENT = ('title', 'text', 'url', 'img', 'context', 'created', 'position')
+
+    provider = models.CharField(max_length=10)
+    account = models.CharField(max_length=30)
+    external_id = models.CharField(max_length=255)
+    title = models.TextField(blank=True)
+    text = models.TextField(blank=True)
+    url = models.TextField(blank=True)
+    img = models.TextField(blank=True)
+    context = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(null=True)
+    # Index in the fetched statuses; orders items without `created`
+    position = models.PositiveSmallIntegerField(default=0)
+
+    objects = ActivityItemManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['provider', 'account', 'external_id'],
+                name='unique_activity_item',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['provider', 'account', '-created'], name='activity_newest'
+            )
+        ]
+
+    def __str__(self):
+        return '%s:%s:%s' % (self.provider, self.account, self.external_id)
@@ -0,0 +1,45 @@
+"""Keep cached activity in step with saved profiles.
+
+Connected in `SnsConfig.ready`. Only accounts whose handle changed are
+refetched: old handles no other profile lists are dropped, and new handles
+are fetched in the background so the first view finds them cached.
+Unchanged handles only lose cached failures, so saving a profile retries
+accounts that weren't found.
+
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .activity import activity_keys, drop_orphans, forget_failures, prewarm
+from .models import Profile
+
+
+@receiver(pre_save, sender=Profile)
+def remember_accounts(sender, instance, raw=False, **kwargs):
+    """Note the accounts `instance` listed before this save."""
+    saved = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._saved_accounts = activity_keys(saved) if saved else {}
+
+
+@receiver(post_save, sender=Profile)
+def update_accounts(sender, instance, raw=False, **kwargs):
+    """Drop activity of replaced handles, failures of kept ones and prewarm
+    added ones."""
+    if raw:
+        # Loading fixtures
+        return
+    saved = getattr(instance, '_saved_accounts', {})
+    accounts = activity_keys(instance)
+    drop_orphans({k: a for k, a in saved.items() if k not in accounts})
+    forget_failures({k: a for k, a in accounts.items() if k in saved})
+    added = {k: a for k, a in accounts.items() if k not in saved}
+    if added:
+        # Fetches outlive the transaction; skip them if it rolls back
+        transaction.on_commit(lambda: prewarm(added))
+
+
+@receiver(post_delete, sender=Profile)
+def forget_accounts(sender, instance, **kwargs):
+    """Drop activity of handles no remaining profile lists."""
+    drop_orphans(activity_keys(instance))
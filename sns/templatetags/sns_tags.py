@@ -1,10 +1,17 @@
 """Custom template tags for `sns` app."""
+from datetime import datetime
 
 from django import template
+import pytz
 register = template.Library()
 
 def get_sns(data, sns):
     """Return value of `sns` in dict `data`."""
     return data.get(sns)
 
-register.filter('get_sns', get_sns)
\ No newline at end of file
+def from_epoch(value):
+    """Return epoch seconds `value` as an aware UTC datetime ('' if unset)."""
+    return datetime.fromtimestamp(value, pytz.utc) if value else ''
+
+register.filter('get_sns', get_sns)
+register.filter('from_epoch', from_epoch)
@@ -0,0 +1,587 @@
+import threading
+import time
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings, SimpleTestCase, TestCase
+
+from sns import local_cache, metrics
+from sns.activity import (
+    activity_key,
+    BoundedExecutor,
+    activity_keys,
+    cache_activity,
+    cache_ttl,
+    decode_entry,
+    drop_orphans,
+    encode_entry,
+    fetch,
+    fetch_many,
+    forget_failures,
+    get_activity,
+    get_cached,
+    last_key,
+    lock_key,
+    merge_session,
+    prewarm,
+    revalidate,
+    SessionRequest,
+    store,
+    stored_activity,
+)
+from sns.api.records import Activity, dumps, Failure, PERMANENT, Status, TRANSIENT
+from sns.api.transport import Deadline
+from sns.models import ActivityItem, Profile
+
+REDDIT = Activity(url='reddit', statuses=[])
+TWITTER = Activity(url='twitter', statuses=[])
+
+
+class BoundedExecutorTests(SimpleTestCase):
+    def test_tasks_beyond_backlog_dropped_until_done(self):
+        executor = BoundedExecutor(1, 2)
+        release = threading.Event()
+
+        futures = [executor.submit(release.wait, 5) for _ in range(3)]
+
+        self.assertIsNotNone(futures[0])
+        self.assertIsNotNone(futures[1])
+        self.assertIsNone(futures[2])
+        release.set()
+        # Slots are freed by done callbacks, right after the results are set
+        for _ in range(50):
+            future = executor.submit(int)
+            if future:
+                break
+            time.sleep(0.01)
+        self.assertEqual(future.result(5), 0)
+
+
+class MergeSessionTests(SimpleTestCase):
+    def test_only_changed_keys_are_copied(self):
+        session = {'meetup_token': 'old', 'other': 1}
+        before = dict(session)
+        after = {'meetup_token': 'new', 'other': 1, 'spotify_token': 'tok'}
+
+        merge_session(session, before, after)
+
+        self.assertEqual(
+            session, {'meetup_token': 'new', 'other': 1, 'spotify_token': 'tok'}
+        )
+
+    def test_session_request_copies_session(self):
+        session = {'meetup_token': 'old'}
+        request = SessionRequest(session)
+        request.session['meetup_token'] = 'new'
+
+        self.assertEqual(session['meetup_token'], 'old')
+
+
+class FetchManyTests(SimpleTestCase):
+    def setUp(self):
+        patch_store = patch('sns.activity.store')
+        self.mock_store = patch_store.start()
+        self.addCleanup(patch_store.stop)
+
+        self.request = SessionRequest({'meetup_token': 'old'})
+        self.accounts = {
+            'test:1:reddit:joe': ('reddit', 'joe'),
+            'test:1:twitter:joe': ('twitter', 'joe'),
+        }
+        self.addCleanup(
+            cache.delete_many,
+            [
+                *self.accounts,
+                *map(lock_key, self.accounts),
+                *map(last_key, self.accounts),
+            ],
+        )
+
+    def test_results_are_returned_and_sessions_merged(self):
+        def reddit(request, acct, deadline):
+            return request, REDDIT
+
+        def twitter(request, acct, deadline):
+            request.session['twitter_token'] = 'tok'
+            return request, TWITTER
+
+        with patch('sns.activity.GetActivity.reddit', side_effect=reddit), patch(
+            'sns.activity.GetActivity.twitter', side_effect=twitter
+        ):
+            request, data, pending = fetch_many(self.request, self.accounts)
+
+        self.assertEqual(pending, [])
+        self.assertEqual(data['test:1:reddit:joe'], REDDIT)
+        self.assertEqual(request.session['twitter_token'], 'tok')
+        self.assertEqual(request.session['meetup_token'], 'old')
+        self.assertEqual(decode_entry(cache.get('test:1:twitter:joe'))[0], TWITTER)
+        self.assertEqual(cache.get(last_key('test:1:twitter:joe')), dumps(TWITTER))
+        # Locks are released once results are cached
+        self.assertIsNone(cache.get(lock_key('test:1:twitter:joe')))
+        self.mock_store.assert_any_call('twitter', 'joe', TWITTER)
+
+    def test_providers_share_upstream_deadline(self):
+        deadlines = []
+
+        def provider(request, acct, deadline):
+            deadlines.append(deadline)
+            return request, REDDIT
+
+        with patch('sns.activity.GetActivity.reddit', side_effect=provider), patch(
+            'sns.activity.GetActivity.twitter', side_effect=provider
+        ):
+            fetch_many(self.request, self.accounts)
+
+        self.assertEqual(len(deadlines), 2)
+        self.assertIsInstance(deadlines[0], Deadline)
+        self.assertIs(deadlines[0], deadlines[1])
+
+    def test_slow_provider_is_pending_and_cached_later(self):
+        release = threading.Event()
+
+        def reddit(request, acct, deadline):
+            return request, REDDIT
+
+        def twitter(request, acct, deadline):
+            release.wait(5)
+            return request, TWITTER
+
+        with patch('sns.activity.GetActivity.reddit', side_effect=reddit), patch(
+            'sns.activity.GetActivity.twitter', side_effect=twitter
+        ):
+            _, data, pending = fetch_many(self.request, self.accounts, timeout=0.2)
+            self.assertEqual(pending, ['test:1:twitter:joe'])
+            self.assertNotIn('test:1:twitter:joe', data)
+
+            release.set()
+            for _ in range(50):
+                if cache.get('test:1:twitter:joe'):
+                    break
+                threading.Event().wait(0.05)
+
+        self.assertEqual(decode_entry(cache.get('test:1:twitter:joe'))[0], TWITTER)
+
+    def test_failed_fetch_serves_last_value_uncached(self):
+        cache.set(last_key('test:1:reddit:joe'), dumps(REDDIT))
+
+        with patch('sns.activity.GetActivity.reddit') as mock_reddit, patch(
+            'sns.activity.GetActivity.twitter'
+        ) as mock_twitter:
+            mock_reddit.side_effect = lambda request, acct, deadline: (request, None)
+            mock_twitter.side_effect = lambda request, acct, deadline: (request, None)
+            _, data, _ = fetch_many(self.request, self.accounts)
+
+        self.assertEqual(
+            data, {'test:1:reddit:joe': REDDIT, 'test:1:twitter:joe': None}
+        )
+        self.assertIsNone(cache.get('test:1:reddit:joe'))
+        self.assertIsNone(cache.get(lock_key('test:1:reddit:joe')))
+        self.mock_store.assert_not_called()
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.key = 'test:1:reddit:joe'
+        self.counters = (
+            'activity:fetches',
+            'activity:coalesced',
+            'activity:lock_fallbacks',
+        )
+        metrics.reset(*self.counters)
+        self.addCleanup(
+            cache.delete_many, [self.key, lock_key(self.key), last_key(self.key)]
+        )
+        self.addCleanup(metrics.reset, *self.counters)
+
+    @patch('sns.activity.GetActivity.reddit')
+    def test_filler_fetches_and_keeps_lock(self, mock_reddit):
+        mock_reddit.side_effect = lambda request, acct, deadline: (request, REDDIT)
+
+        self.assertEqual(fetch({}, self.key, 'reddit', 'joe'), ({}, REDDIT, True))
+        self.assertIsNotNone(cache.get(lock_key(self.key)))
+        self.assertEqual(metrics.get(*self.counters)['activity:fetches'], 1)
+
+    @patch('sns.activity.GetActivity.reddit')
+    def test_waiter_uses_value_filled_by_other_process(self, mock_reddit):
+        cache.set(lock_key(self.key), 1)
+        entry = encode_entry(REDDIT, 0)
+        threading.Timer(0.2, cache.set, args=(self.key, entry)).start()
+
+        self.assertEqual(fetch({}, self.key, 'reddit', 'joe'), ({}, REDDIT, False))
+        mock_reddit.assert_not_called()
+        self.assertEqual(metrics.get(*self.counters)['activity:coalesced'], 1)
+
+    @override_settings(ACTIVITY_LOCK_WAIT=0.2)
+    @patch('sns.activity.GetActivity.reddit')
+    def test_waiter_falls_back_to_last_value(self, mock_reddit):
+        cache.set(lock_key(self.key), 1)
+        cache.set(last_key(self.key), dumps(REDDIT))
+
+        self.assertEqual(fetch({}, self.key, 'reddit', 'joe'), ({}, REDDIT, False))
+        mock_reddit.assert_not_called()
+        self.assertEqual(metrics.get(*self.counters)['activity:lock_fallbacks'], 1)
+
+
+class SharedKeyTests(TestCase):
+    def setUp(self):
+        local_cache.get_local().clear()
+        self.profile = Profile.objects.create(name='Harry', reddit='joe', twitter='jo')
+        self.keys = activity_keys(self.profile)
+        self.old = activity_key('reddit', 'old')
+        self.addCleanup(
+            cache.delete_many,
+            [
+                *self.keys,
+                *map(last_key, self.keys),
+                self.old,
+                last_key(self.old),
+            ],
+        )
+
+    def cache(self, *accounts):
+        cache_activity(
+            {activity_key(sns, acct): (sns, REDDIT) for sns, acct in accounts}
+        )
+
+    def test_activity_keys(self):
+        self.assertEqual(
+            self.keys,
+            {
+                'activity:reddit:joe': ('reddit', 'joe'),
+                'activity:twitter:jo': ('twitter', 'jo'),
+            },
+        )
+
+    def test_profiles_share_activity_of_same_account(self):
+        other = Profile.objects.create(name='Sally', reddit='joe')
+
+        with patch('sns.activity.GetActivity.reddit') as mock_reddit, patch(
+            'sns.activity.GetActivity.twitter'
+        ) as mock_twitter:
+            mock_reddit.side_effect = lambda request, acct, deadline: (request, REDDIT)
+            mock_twitter.side_effect = lambda request, acct, deadline: (
+                request,
+                TWITTER,
+            )
+            _, data, _ = get_activity(SessionRequest({}), self.profile)
+            _, other_data, _ = get_activity(SessionRequest({}), other)
+
+        mock_reddit.assert_called_once()
+        self.assertEqual(data['reddit'], REDDIT)
+        self.assertEqual(other_data, {'reddit': REDDIT})
+
+    def test_local_entries_skip_shared_cache(self):
+        self.cache(('reddit', 'joe'), ('twitter', 'jo'))
+
+        with patch('sns.activity.cache') as mock_cache:
+            cached = get_cached(self.profile)
+
+        mock_cache.get_many.assert_not_called()
+        self.assertEqual(decode_entry(cached['activity:reddit:joe'])[0], REDDIT)
+
+    def test_drop_orphans_keeps_listed_accounts(self):
+        self.cache(('reddit', 'old'), ('twitter', 'jo'))
+        store('reddit', 'old', Activity(statuses=[Status(id='1')]))
+
+        drop_orphans({self.old: ('reddit', 'old'), **self.keys})
+
+        self.assertIsNone(cache.get(self.old))
+        self.assertIsNone(cache.get(last_key(self.old)))
+        self.assertEqual(local_cache.get_local().get_many([self.old]), {})
+        self.assertFalse(ActivityItem.objects.filter(account='old').exists())
+        self.assertIsNotNone(cache.get('activity:twitter:jo'))
+
+    @override_settings(ACTIVITY_REFRESH_CONCURRENCY={'reddit': 1, 'twitter': 1})
+    @patch('sns.activity.get_refresh_executor')
+    def test_prewarm_fetches_uncached_accounts(self, mock_executor):
+        self.cache(('reddit', 'joe'))
+
+        prewarm({**self.keys, 'activity:meetup:1': ('meetup', '1')})
+
+        mock_executor.return_value.submit.assert_called_once_with(
+            revalidate, {}, 'activity:twitter:jo', 'twitter', 'jo'
+        )
+
+
+@override_settings(
+    ACTIVITY_CACHE_TTL={
+        'default': {'soft': 60, 'hard': 600},
+        'reddit': {'soft': 30},
+    }
+)
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def setUp(self):
+        local_cache.get_local().clear()
+        self.profile = Profile(pk=-1, name='Harry', reddit='joe')
+        self.key = activity_key('reddit', 'joe')
+        self.request = SessionRequest({})
+        self.addCleanup(
+            cache.delete_many,
+            [self.key, lock_key(self.key), last_key(self.key)],
+        )
+
+        patch_executor = patch('sns.activity.get_refresh_executor')
+        self.mock_executor = patch_executor.start()
+        self.addCleanup(patch_executor.stop)
+
+        patch_store = patch('sns.activity.store')
+        self.mock_store = patch_store.start()
+        self.addCleanup(patch_store.stop)
+
+        patch_stored = patch('sns.activity.stored_activity', return_value=None)
+        patch_stored.start()
+        self.addCleanup(patch_stored.stop)
+
+    def test_cache_ttl_falls_back_to_default(self):
+        self.assertEqual(cache_ttl('reddit'), (30, 600))
+        self.assertEqual(cache_ttl('twitter'), (60, 600))
+
+    def test_entry_in_older_format_is_refetched(self):
+        cache.set(self.key, (REDDIT, time.time() + 60))
+
+        with patch('sns.activity.fetch_many') as mock_fetch_many:
+            mock_fetch_many.return_value = (self.request, {self.key: REDDIT}, [])
+            _, data, _ = get_activity(self.request, self.profile)
+
+        mock_fetch_many.assert_called_once()
+        self.assertEqual(data, {'reddit': REDDIT})
+
+    def test_fresh_entry_is_served_without_refresh(self):
+        cache.set(self.key, encode_entry(REDDIT, time.time() + 60))
+
+        _, data, loading = get_activity(self.request, self.profile)
+
+        self.assertEqual(data, {'reddit': REDDIT})
+        self.assertEqual(loading, [])
+        self.mock_executor.return_value.submit.assert_not_called()
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        cache.set(self.key, encode_entry(REDDIT, time.time() - 1))
+
+        _, data, loading = get_activity(self.request, self.profile)
+
+        self.assertEqual(data, {'reddit': REDDIT})
+        self.assertEqual(local_cache.get_local().get_many([self.key]), {})
+        self.mock_executor.return_value.submit.assert_called_once_with(
+            revalidate, {}, self.key, 'reddit', 'joe'
+        )
+
+    @patch('sns.activity.GetActivity.reddit')
+    def test_revalidate_writes_fresh_entry(self, mock_reddit):
+        mock_reddit.side_effect = lambda request, acct, deadline: (request, REDDIT)
+
+        revalidate({}, self.key, 'reddit', 'joe')
+
+        data, fresh_until = decode_entry(cache.get(self.key))
+        self.assertEqual(data, REDDIT)
+        self.assertGreater(fresh_until, time.time() + 25)
+        self.assertIsNone(cache.get(lock_key(self.key)))
+        self.mock_store.assert_called_once_with('reddit', 'joe', REDDIT)
+
+    @patch('sns.activity.GetActivity.reddit')
+    def test_failed_revalidate_keeps_stale_entry(self, mock_reddit):
+        mock_reddit.side_effect = lambda request, acct, deadline: (request, None)
+        entry = encode_entry(REDDIT, time.time() - 1)
+        cache.set(self.key, entry)
+
+        revalidate({}, self.key, 'reddit', 'joe')
+
+        self.assertEqual(cache.get(self.key), entry)
+        self.assertIsNone(cache.get(lock_key(self.key)))
+        self.mock_store.assert_not_called()
+
+    @patch('sns.activity.GetActivity.reddit')
+    def test_permanent_failure_is_cached_and_served_as_none(self, mock_reddit):
+        mock_reddit.side_effect = lambda request, acct, deadline: (
+            request,
+            Failure(PERMANENT, 'NotFound'),
+        )
+
+        revalidate({}, self.key, 'reddit', 'joe')
+        _, data, loading = get_activity(self.request, self.profile)
+
+        self.assertEqual(data, {'reddit': None})
+        self.assertEqual(loading, [])
+        self.assertGreater(cache.ttl(self.key), 60 * 60 * 24)
+        self.assertIsNone(cache.get(last_key(self.key)))
+        self.mock_executor.return_value.submit.assert_not_called()
+
+    def test_transient_failure_serves_last_value(self):
+        cache.set(last_key(self.key), dumps(REDDIT))
+        cache_activity({self.key: ('reddit', Failure(TRANSIENT, 'Timeout'))})
+        local_cache.get_local().clear()
+
+        _, data, _ = get_activity(self.request, self.profile)
+
+        self.assertEqual(data, {'reddit': REDDIT})
+        self.mock_executor.return_value.submit.assert_not_called()
+
+    @patch('sns.activity.GetActivity.reddit')
+    def test_transient_revalidate_failure_keeps_stale_entry(self, mock_reddit):
+        mock_reddit.side_effect = lambda request, acct, deadline: (
+            request,
+            Failure(TRANSIENT, 'Exception'),
+        )
+        entry = encode_entry(REDDIT, time.time() - 1)
+        cache.set(self.key, entry)
+
+        revalidate({}, self.key, 'reddit', 'joe')
+
+        self.assertEqual(cache.get(self.key), entry)
+
+    def test_forget_failures_keeps_activity(self):
+        cache_activity({self.key: ('reddit', Failure(PERMANENT))})
+        forget_failures({self.key: ('reddit', 'joe')})
+        self.assertIsNone(cache.get(self.key))
+
+        cache_activity({self.key: ('reddit', REDDIT)})
+        forget_failures({self.key: ('reddit', 'joe')})
+        self.assertIsNotNone(cache.get(self.key))
+
+    @patch('sns.activity.GetActivity.meetup')
+    def test_revalidate_skipped_while_meetup_token_expired(self, mock_meetup):
+        session = {'meetup_token': {'expires_at': time.time() - 1}}
+
+        revalidate(session, 'activity:meetup:1', 'meetup', '1')
+
+        mock_meetup.assert_not_called()
+
+    @patch('sns.activity.refresh_meetup_token')
+    def test_expired_meetup_token_refreshed_before_background_fetches(
+        self, mock_refresh
+    ):
+        def refresh(session):
+            session['meetup_token'] = {'expires_at': time.time() + 3600}
+
+        mock_refresh.side_effect = refresh
+        profile = Profile(pk=-1, name='Harry', meetup='1')
+        key = activity_key('meetup', '1')
+        self.addCleanup(cache.delete, key)
+        cache.set(key, encode_entry(REDDIT, time.time() - 1))
+        request = SessionRequest({'meetup_token': {'expires_at': time.time() - 1}})
+
+        get_activity(request, profile)
+
+        session = self.mock_executor.return_value.submit.call_args[0][1]
+        self.assertGreater(session['meetup_token']['expires_at'], time.time())
+        self.assertEqual(request.session['meetup_token'], session['meetup_token'])
+
+    @patch('sns.activity.GetActivity.reddit')
+    def test_revalidate_skipped_when_already_running(self, mock_reddit):
+        cache.set(lock_key(self.key), 1)
+
+        revalidate({}, self.key, 'reddit', 'joe')
+
+        mock_reddit.assert_not_called()
+
+
+class StoredActivityTests(TestCase):
+    def setUp(self):
+        local_cache.get_local().clear()
+        self.profile = Profile(pk=-1, name='Harry', reddit='joe')
+        self.key = activity_key('reddit', 'joe')
+        self.addCleanup(
+            cache.delete_many,
+            [self.key, lock_key(self.key), last_key(self.key)],
+        )
+
+        patch_executor = patch('sns.activity.get_refresh_executor')
+        self.mock_executor = patch_executor.start()
+        self.addCleanup(patch_executor.stop)
+
+    def statuses(self, *ids):
+        return [
+            Status(
+                title='post %s' % i, url='https://redd.it/%s' % i, created=i, id=str(i)
+            )
+            for i in ids
+        ]
+
+    def test_store_upserts_and_removes_missing_items(self):
+        store('reddit', 'joe', Activity(statuses=self.statuses(1, 2)))
+        kept = ActivityItem.objects.get(external_id='2').pk
+
+        store('reddit', 'joe', Activity(statuses=self.statuses(2, 3)))
+
+        self.assertEqual(
+            sorted(ActivityItem.objects.values_list('external_id', flat=True)),
+            ['2', '3'],
+        )
+        self.assertEqual(ActivityItem.objects.get(external_id='2').pk, kept)
+
+    @patch('sns.activity.GetActivity.reddit')
+    def test_partial_fetch_cached_briefly_and_not_stored(self, mock_reddit):
+        store('reddit', 'joe', Activity(statuses=self.statuses(1)))
+        cache.set(last_key(self.key), dumps(REDDIT))
+        partial = Activity(statuses=[], partial=True)
+        mock_reddit.side_effect = lambda request, acct, deadline: (request, partial)
+
+        revalidate({}, self.key, 'reddit', 'joe')
+
+        data, fresh_until = decode_entry(cache.get(self.key))
+        self.assertEqual(data, partial)
+        self.assertLessEqual(fresh_until, time.time() + 30)
+        self.assertEqual(cache.get(last_key(self.key)), dumps(REDDIT))
+        self.assertEqual(ActivityItem.objects.count(), 1)
+
+    @patch('sns.activity.GetActivity.reddit')
+    def test_paused_fetch_fresh_until_pause_ends_and_not_stored(self, mock_reddit):
+        store('reddit', 'joe', Activity(statuses=self.statuses(1)))
+        paused = Activity(statuses=[], paused_until=int(time.time()) + 60)
+        mock_reddit.side_effect = lambda request, acct, deadline: (request, paused)
+
+        revalidate({}, self.key, 'reddit', 'joe')
+
+        data, fresh_until = decode_entry(cache.get(self.key))
+        self.assertEqual(data, paused)
+        self.assertLessEqual(fresh_until, paused.paused_until)
+        self.assertIsNone(cache.get(last_key(self.key)))
+        self.assertEqual(ActivityItem.objects.count(), 1)
+
+    def test_store_updates_changed_items(self):
+        store('reddit', 'joe', Activity(statuses=self.statuses(1)))
+        changed = self.statuses(1)[0]._replace(title='edited')
+
+        store('reddit', 'joe', Activity(statuses=[changed]))
+
+        self.assertEqual(ActivityItem.objects.get().title, 'edited')
+
+    def test_failed_fetch_keeps_stored_items(self):
+        store('reddit', 'joe', Activity(statuses=self.statuses(1)))
+
+        store('reddit', 'joe', None)
+
+        self.assertEqual(ActivityItem.objects.count(), 1)
+
+    def test_stored_activity_newest_first(self):
+        store('reddit', 'joe', Activity(statuses=self.statuses(1, 3, 2)))
+
+        with override_settings(ACTIVITY_STORED_ITEMS=2):
+            activity = stored_activity('reddit', 'joe')
+
+        self.assertEqual(activity.url, 'https://www.reddit.com/user/joe')
+        self.assertEqual(activity.statuses, self.statuses(3, 2))
+        self.assertIsNone(stored_activity('reddit', 'jane'))
+
+    def test_undated_items_stored_after_dated_in_fetch_order(self):
+        undated = [s._replace(created=0) for s in self.statuses(5, 4)]
+        store('reddit', 'joe', Activity(statuses=[undated[0], *self.statuses(2)]))
+        refetched = [undated[0], *self.statuses(2), undated[1]]
+        store('reddit', 'joe', Activity(statuses=refetched))
+
+        activity = stored_activity('reddit', 'joe')
+
+        self.assertEqual(activity.statuses, [*self.statuses(2), *undated])
+
+    def test_uncached_activity_served_from_store_and_refreshed(self):
+        store('reddit', 'joe', Activity(statuses=self.statuses(1)))
+
+        with patch('sns.activity.fetch_many') as mock_fetch_many:
+            _, data, loading = get_activity(SessionRequest({}), self.profile)
+
+        mock_fetch_many.assert_not_called()
+        self.assertEqual(data['reddit'].statuses, self.statuses(1))
+        self.assertEqual(loading, [])
+        self.mock_executor.return_value.submit.assert_called_once_with(
+            revalidate, {}, self.key, 'reddit', 'joe'
+        )
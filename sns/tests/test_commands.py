@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+import time
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings, TestCase
+
+from sns.activity import encode_entry, record_view, recent_views, view_keys
+from sns.api.records import Activity
+from sns.management.commands.refresh_scheduler import Command, plan
+from sns.models import Profile
+
+
+@override_settings(
+    ACTIVITY_CACHE_TTL={'default': {'soft': 600, 'hard': 3600}},
+    ACTIVITY_REFRESH_CONCURRENCY={'reddit': 1, 'twitter': 1},
+    ACTIVITY_REFRESH_LEAD=60,
+    ACTIVITY_REFRESH_VIEW_WEIGHT=10,
+)
+class RefreshSchedulerTests(TestCase):
+    def setUp(self):
+        self.popular = Profile.objects.create(name='Popular', reddit='pop', meetup='1')
+        self.viewed = Profile.objects.create(name='Viewed', reddit='view')
+        self.unviewed = Profile.objects.create(name='Unviewed', twitter='none')
+        profiles = (self.popular, self.viewed, self.unviewed)
+        self.addCleanup(
+            cache.delete_many,
+            [
+                *(k for p in profiles for k in view_keys(p.pk)),
+                'activity:reddit:pop',
+                'activity:reddit:view',
+            ],
+        )
+        for _ in range(3):
+            record_view(self.popular.pk)
+        record_view(self.viewed.pk)
+
+    def test_recent_views(self):
+        self.assertEqual(
+            recent_views([self.popular.pk, self.unviewed.pk]),
+            {self.popular.pk: 3, self.unviewed.pk: 0},
+        )
+
+    def test_plan_orders_by_staleness_and_views(self):
+        now = time.time()
+        # Equally stale; popularity breaks the tie
+        cache.set('activity:reddit:pop', encode_entry(Activity(), now))
+        cache.set('activity:reddit:view', encode_entry(Activity(), now))
+
+        heap = plan(now)
+
+        self.assertEqual(
+            [r.key for r in sorted(heap)],
+            ['activity:reddit:pop', 'activity:reddit:view'],
+        )
+        self.assertEqual(sorted(heap)[0].due, now - 60)
+        self.assertEqual(sorted(heap)[0].priority, now - 60 - 30)
+
+    def test_shared_account_planned_once_with_all_views(self):
+        fan = Profile.objects.create(name='Fan', reddit='pop')
+        self.addCleanup(cache.delete_many, view_keys(fan.pk))
+        record_view(fan.pk)
+
+        heap = plan()
+
+        self.assertEqual(
+            [(r.key, r.views) for r in sorted(heap)],
+            [('activity:reddit:pop', 4), ('activity:reddit:view', 1)],
+        )
+
+    def test_uncached_entries_due_now(self):
+        now = time.time()
+
+        self.assertEqual({r.due for r in plan(now)}, {now})
+
+    def test_dry_run_prints_schedule(self):
+        out = StringIO()
+        with patch('sns.management.commands.refresh_scheduler.revalidate') as mock:
+            call_command('refresh_scheduler', '--dry-run', stdout=out)
+
+        mock.assert_not_called()
+        self.assertIn('activity:reddit:pop', out.getvalue())
+        self.assertNotIn('twitter:none', out.getvalue())
+        # 2 entries, 2 calls per Reddit refresh, every 10 minutes
+        self.assertIn(
+            '2 entries kept warm, ~0.4 upstream calls per minute.', out.getvalue()
+        )
+
+    def test_tick_respects_provider_limits(self):
+        command = Command()
+        executor = Mock()
+        command.prepare(executor)
+
+        command.tick(plan())
+
+        # Both Reddit entries are due; only one may run at a time
+        executor.submit.assert_called_once()
+        self.assertEqual(len(command.pending['reddit']), 1)
+
+    def test_queued_refresh_runs_when_slot_frees(self):
+        command = Command()
+        running = []
+        overlap = []
+        refreshed = []
+
+        def revalidate(session, key, sns, acct):
+            running.append(key)
+            overlap.append(len(running))
+            time.sleep(0.01)
+            refreshed.append(key)
+            running.remove(key)
+
+        with patch(
+            'sns.management.commands.refresh_scheduler.revalidate', revalidate
+        ), ThreadPoolExecutor(max_workers=2) as executor:
+            command.prepare(executor)
+            command.tick(plan())
+            # Queued refreshes aren't queued twice by a later scan
+            command.tick(plan())
+            command.join()
+
+        self.assertEqual(refreshed, ['activity:reddit:pop', 'activity:reddit:view'])
+        self.assertEqual(max(overlap), 1)
+        self.assertEqual(command.queued, set())
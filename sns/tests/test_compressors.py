@@ -0,0 +1,42 @@
+import zlib
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django_redis.exceptions import CompressorError
+
+from sns.compressors import MeteredZlibCompressor
+
+
+class MeteredZlibCompressorTests(SimpleTestCase):
+    def setUp(self):
+        self.compressor = MeteredZlibCompressor({'COMPRESS_MIN_LENGTH': 10})
+
+    def test_short_values_stored_as_is(self):
+        self.assertEqual(self.compressor.compress(b'short'), b'short')
+        with self.assertRaises(CompressorError):
+            self.compressor.decompress(b'short')
+
+    def test_long_values_round_trip(self):
+        value = b'x' * 100
+        compressed = self.compressor.compress(value)
+
+        self.assertEqual(zlib.decompress(compressed), value)
+        self.assertEqual(self.compressor.decompress(compressed), value)
+        self.assertEqual(self.compressor.metrics.counts['bytes_in'], 100)
+        self.assertEqual(
+            self.compressor.metrics.counts['bytes_out'], len(compressed)
+        )
+
+
+
+class CacheCompressionTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(cache.delete_many, ['test:small', 'test:large'])
+
+    def test_values_round_trip_through_cache(self):
+        cache.set_many({'test:small': 'x', 'test:large': 'x' * 10000})
+
+        self.assertEqual(
+            cache.get_many(['test:small', 'test:large']),
+            {'test:small': 'x', 'test:large': 'x' * 10000},
+        )
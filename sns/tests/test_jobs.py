@@ -0,0 +1,71 @@
+from unittest.mock import call, patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from django_redis import get_redis_connection
+
+from sns import jobs
+from sns.models import Profile
+
+
+class RefreshQueueTests(TestCase):
+    def setUp(self):
+        self.profile = Profile.objects.create(name='Harry', reddit='joe', twitter='jo')
+        get_redis_connection('default').delete(jobs.QUEUE_KEY)
+        self.addCleanup(get_redis_connection('default').delete, jobs.QUEUE_KEY)
+        self.addCleanup(
+            cache.delete_many,
+            [
+                jobs.queued_key(self.profile.pk),
+                jobs.queued_key(self.profile.pk, 'twitter'),
+            ],
+        )
+
+    def test_repeated_refreshes_queued_once(self):
+        session = {'meetup_token': 'tok', 'other': 1}
+
+        self.assertTrue(jobs.enqueue_refresh(self.profile, session))
+        self.assertFalse(jobs.enqueue_refresh(self.profile, session))
+
+        self.assertEqual(jobs.refreshing(self.profile), ['reddit', 'twitter'])
+        self.assertEqual(
+            jobs.pop(timeout=1),
+            {'pk': self.profile.pk, 'sns': None, 'session': {'meetup_token': 'tok'}},
+        )
+        self.assertIsNone(jobs.pop(timeout=1))
+
+    @patch('sns.jobs.local_cache.invalidate')
+    @patch('sns.jobs.revalidate')
+    def test_run_refreshes_every_account(self, mock_revalidate, mock_invalidate):
+        jobs.enqueue_refresh(self.profile, {})
+
+        jobs.run(jobs.pop(timeout=1))
+
+        mock_revalidate.assert_has_calls(
+            [
+                call({}, 'activity:reddit:joe', 'reddit', 'joe'),
+                call({}, 'activity:twitter:jo', 'twitter', 'jo'),
+            ],
+            any_order=True,
+        )
+        mock_invalidate.assert_called_once()
+        # Refreshes can be asked for again
+        self.assertEqual(jobs.refreshing(self.profile), [])
+
+    @patch('sns.jobs.local_cache.invalidate')
+    @patch('sns.jobs.revalidate')
+    def test_provider_refresh_leaves_other_accounts(
+        self, mock_revalidate, mock_invalidate
+    ):
+        self.assertTrue(jobs.enqueue_refresh(self.profile, {}, 'twitter'))
+        self.assertEqual(jobs.refreshing(self.profile), ['twitter'])
+
+        jobs.run(jobs.pop(timeout=1))
+
+        mock_revalidate.assert_called_once_with(
+            {}, 'activity:twitter:jo', 'twitter', 'jo'
+        )
+        mock_invalidate.assert_called_once_with(
+            {'activity:twitter:jo': ('twitter', 'jo')}
+        )
+        self.assertEqual(jobs.refreshing(self.profile), [])
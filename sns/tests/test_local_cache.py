@@ -0,0 +1,50 @@
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from sns.local_cache import _listen, invalidate, LocalCache
+
+
+class LocalCacheTests(SimpleTestCase):
+    def test_least_recently_used_evicted_over_max_entries(self):
+        local = LocalCache(max_entries=2, max_bytes=100, ttl=60)
+        local.set_many({'a': 'a', 'b': 'b'})
+        local.get_many(['a'])
+        local.set_many({'c': 'c'})
+
+        self.assertEqual(local.get_many(['a', 'b', 'c']), {'a': 'a', 'c': 'c'})
+
+    def test_evicted_over_max_bytes(self):
+        local = LocalCache(max_entries=10, max_bytes=5, ttl=60)
+        local.set_many({'a': 'xxx', 'b': 'yyy', 'c': 'x' * 6})
+
+        self.assertEqual(local.get_many(['a', 'b', 'c']), {'b': 'yyy'})
+        self.assertEqual(local._bytes, 3)
+
+    def test_expired_entries_dropped(self):
+        local = LocalCache(max_entries=10, max_bytes=100, ttl=60)
+        local.set_many({'a': 'a'})
+
+        later = time.monotonic() + 61
+        with patch('sns.local_cache.time.monotonic', return_value=later):
+            self.assertEqual(local.get_many(['a']), {})
+        self.assertEqual(len(local), 0)
+
+
+class InvalidationTests(SimpleTestCase):
+    def test_invalidation_reaches_other_processes(self):
+        # Stand-in for the cache of another process
+        other = LocalCache(max_entries=10, max_bytes=100, ttl=60)
+        other.set_many({'test:a': 'a', 'test:b': 'b'})
+        threading.Thread(target=_listen, args=(other,), daemon=True).start()
+        time.sleep(0.2)  # Let the listener subscribe
+
+        invalidate(['test:a'])
+        for _ in range(50):
+            if len(other) == 1:
+                break
+            time.sleep(0.05)
+
+        self.assertEqual(other.get_many(['test:a', 'test:b']), {'test:b': 'b'})
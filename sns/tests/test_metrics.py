@@ -0,0 +1,29 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from sns import metrics
+
+
+class BufferTests(SimpleTestCase):
+    def setUp(self):
+        self.names = ('test:hits', 'test:misses')
+        metrics.reset(*self.names)
+        self.addCleanup(metrics.reset, *self.names)
+
+    def test_counts_kept_within_interval(self):
+        buffer = metrics.Buffer('test:')
+        buffer.add(hits=1)
+        buffer.add(hits=2, misses=1)
+
+        self.assertEqual(buffer.counts, {'hits': 3, 'misses': 1})
+        self.assertEqual(metrics.get(*self.names), {'test:hits': 0, 'test:misses': 0})
+
+    def test_counts_flushed_after_interval(self):
+        buffer = metrics.Buffer('test:')
+        buffer.add(hits=1)
+        with patch('sns.metrics.FLUSH_INTERVAL', 0):
+            buffer.add(hits=2, misses=1)
+
+        self.assertEqual(buffer.counts, {})
+        self.assertEqual(metrics.get(*self.names), {'test:hits': 3, 'test:misses': 1})
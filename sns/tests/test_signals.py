@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings, TestCase
+
+from sns.activity import cache_activity, last_key, revalidate
+from sns.api.records import Activity, Failure, PERMANENT
+from sns.models import Profile
+
+KEYS = ('activity:reddit:joe', 'activity:reddit:new', 'activity:twitter:jo')
+
+
+@override_settings(ACTIVITY_REFRESH_CONCURRENCY={'reddit': 1, 'twitter': 1})
+class ProfileSignalTests(TestCase):
+    def setUp(self):
+        # Run prewarms right away rather than when the test transaction commits
+        patch_on_commit = patch(
+            'sns.signals.transaction.on_commit', side_effect=lambda func: func()
+        )
+        patch_on_commit.start()
+        self.addCleanup(patch_on_commit.stop)
+
+        patch_executor = patch('sns.activity.get_refresh_executor')
+        self.submit = patch_executor.start().return_value.submit
+        self.addCleanup(patch_executor.stop)
+
+        self.profile = Profile.objects.create(name='Harry', reddit='joe', twitter='jo')
+        cache_activity(
+            {
+                'activity:reddit:joe': ('reddit', Activity()),
+                'activity:twitter:jo': ('twitter', Activity()),
+            }
+        )
+        self.submit.reset_mock()
+        self.addCleanup(
+            cache.delete_many,
+            [*KEYS, *map(last_key, KEYS)],
+        )
+
+    def test_new_profile_prewarms_uncached_accounts(self):
+        Profile.objects.create(name='Sally', reddit='new', twitter='jo', meetup='1')
+
+        self.submit.assert_called_once_with(
+            revalidate, {}, 'activity:reddit:new', 'reddit', 'new'
+        )
+
+    def test_edit_drops_only_replaced_handle(self):
+        self.profile.reddit = 'new'
+        self.profile.save()
+
+        self.assertIsNone(cache.get('activity:reddit:joe'))
+        self.assertIsNotNone(cache.get('activity:twitter:jo'))
+        self.submit.assert_called_once_with(
+            revalidate, {}, 'activity:reddit:new', 'reddit', 'new'
+        )
+
+    def test_unchanged_save_keeps_cache(self):
+        self.profile.name = 'Harriet'
+        self.profile.save()
+
+        self.assertIsNotNone(cache.get('activity:reddit:joe'))
+        self.submit.assert_not_called()
+
+    def test_save_forgets_failures_of_kept_handles(self):
+        cache_activity({'activity:reddit:joe': ('reddit', Failure(PERMANENT))})
+
+        self.profile.save()
+
+        self.assertIsNone(cache.get('activity:reddit:joe'))
+        self.assertIsNotNone(cache.get('activity:twitter:jo'))
+
+    def test_delete_keeps_handles_listed_elsewhere(self):
+        Profile.objects.create(name='Sally', reddit='joe')
+
+        self.profile.delete()
+
+        self.assertIsNotNone(cache.get('activity:reddit:joe'))
+        self.assertIsNone(cache.get('activity:twitter:jo'))
@@ -1,7 +1,15 @@
+import time
+from unittest.mock import patch
+
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from django.urls.exceptions import NoReverseMatch
 
+from sns import metrics
+from sns.api.records import Activity, Status
+from sns.api.utils import BREAKER_FAILURES, CircuitBreaker
+from sns.jobs import queued_key
 from sns.models import Profile
 
 
@@ -153,6 +161,70 @@ class ActivityView(TestCase):
         response = self.client.get(reverse('activity', kwargs={'pk': 100000}))
         self.assertEqual(response.status_code, 404)
 
+    @patch('sns.views.get_activity')
+    def test_shell_links_cards_without_fetching(self, mock_activity):
+        pk = self.profile.pk
+        response = self.client.get(reverse('activity', kwargs={'pk': pk}))
+
+        for sns in ('reddit', 'twitter'):
+            self.assertContains(
+                response, reverse('activity_card', kwargs={'pk': pk, 'sns': sns})
+            )
+        self.assertNotContains(
+            response, reverse('activity_card', kwargs={'pk': pk, 'sns': 'spotify'})
+        )
+        mock_activity.assert_not_called()
+
+
+class ActivityCardTests(TestCase):
+    def setUp(self):
+        self.profile = Profile.objects.create(name='Harry', twitter='jo')
+        self.url = reverse(
+            'activity_card', kwargs={'pk': self.profile.pk, 'sns': 'twitter'}
+        )
+
+    @patch('sns.views.get_activity')
+    def test_card_of_one_provider(self, mock_activity):
+        twitter = Activity(
+            url='https://twitter.com/jo',
+            statuses=[Status(text='Hello', url='https://twitter.com/jo/1')],
+        )
+        mock_activity.side_effect = lambda request, profile, only: (
+            request,
+            {only: twitter},
+            [],
+        )
+
+        card = self.client.get(self.url).json()
+
+        self.assertEqual(mock_activity.call_args[1], {'only': 'twitter'})
+        self.assertEqual(card['sns'], 'twitter')
+        self.assertFalse(card['loading'])
+        self.assertIn('Hello', card['html'])
+        self.assertIn('https://twitter.com/jo', card['html'])
+
+    @patch('sns.views.get_activity')
+    def test_card_still_loading(self, mock_activity):
+        mock_activity.side_effect = lambda request, profile, only: (
+            request,
+            {},
+            [only],
+        )
+
+        card = self.client.get(self.url).json()
+
+        self.assertTrue(card['loading'])
+        self.assertIn('Still loading.', card['html'])
+
+    @patch('sns.views.get_activity')
+    def test_card_of_unset_provider_not_found(self, mock_activity):
+        for sns in ('reddit', 'pk'):
+            response = self.client.get(
+                reverse('activity_card', kwargs={'pk': self.profile.pk, 'sns': sns})
+            )
+            self.assertEqual(response.status_code, 404)
+        mock_activity.assert_not_called()
+
 
 class ProfileNewTests(TestCase):
     def setUp(self):
@@ -304,3 +376,110 @@ class ProfileDeleteTests(TestCase):
         response = self.del_profile(pk)
         self.assertTrue(response.status_code, 200)
         self.assertFalse(Profile.objects.filter(pk=pk).exists())
+
+
+class CacheStatsTests(TestCase):
+    def setUp(self):
+        self.names = [
+            'activity:%s_%s' % (tier, kind)
+            for tier in ('local', 'shared')
+            for kind in ('hits', 'misses')
+        ]
+        metrics.reset(*self.names)
+        self.addCleanup(metrics.reset, *self.names)
+
+    def test_hit_rate_of_each_tier(self):
+        metrics.incr('activity:local_hits', 3)
+        metrics.incr('activity:local_misses', 1)
+
+        response = self.client.get(reverse('cache_stats'))
+
+        self.assertEqual(
+            response.json(),
+            {
+                'local': {'hits': 3, 'misses': 1, 'hit_rate': 0.75},
+                'shared': {'hits': 0, 'misses': 0, 'hit_rate': None},
+            },
+        )
+
+
+class BreakerStatsTests(TestCase):
+    def setUp(self):
+        self.keys = [
+            key
+            for sns in ('meetup', 'reddit', 'spotify', 'twitter')
+            for key in CircuitBreaker.keys(sns)
+        ]
+        cache.delete_many(self.keys)
+        self.addCleanup(cache.delete_many, self.keys)
+
+    def test_state_of_each_provider(self):
+        breaker = CircuitBreaker('spotify')
+        for _ in range(BREAKER_FAILURES):
+            breaker.failure()
+
+        response = self.client.get(reverse('breaker_stats'))
+
+        data = response.json()
+        self.assertEqual(set(data), {'meetup', 'reddit', 'spotify', 'twitter'})
+        self.assertEqual(data['spotify']['state'], 'open')
+        self.assertGreater(data['spotify']['open_until'], time.time())
+        self.assertEqual(
+            data['reddit'], {'state': 'closed', 'failures': 0, 'open_until': None}
+        )
+
+
+class RefreshActivityTests(TestCase):
+    def setUp(self):
+        self.profile = Profile.objects.create(name='Harry', twitter='jo')
+        self.addCleanup(
+            cache.delete_many,
+            [queued_key(self.profile.pk), queued_key(self.profile.pk, 'twitter')],
+        )
+        patch_activity = patch(
+            'sns.views.get_activity',
+            side_effect=lambda request, profile, only: (request, {}, []),
+        )
+        patch_activity.start()
+        self.addCleanup(patch_activity.stop)
+
+    @patch('sns.views.enqueue_refresh')
+    def test_refresh_is_queued(self, mock_enqueue):
+        response = self.client.get(
+            reverse('refresh_activity', kwargs={'pk': self.profile.pk})
+        )
+
+        self.assertRedirects(
+            response, reverse('activity', kwargs={'pk': self.profile.pk})
+        )
+        self.assertEqual(mock_enqueue.call_args[0][0], self.profile)
+
+    @patch('sns.views.enqueue_refresh')
+    def test_provider_refresh_is_queued(self, mock_enqueue):
+        response = self.client.get(
+            reverse(
+                'refresh_provider', kwargs={'pk': self.profile.pk, 'sns': 'twitter'}
+            )
+        )
+
+        self.assertRedirects(
+            response, reverse('activity', kwargs={'pk': self.profile.pk})
+        )
+        self.assertEqual(mock_enqueue.call_args[0][2], 'twitter')
+
+    @patch('sns.views.enqueue_refresh')
+    def test_refresh_of_unset_provider_not_found(self, mock_enqueue):
+        for sns in ('reddit', 'pk'):
+            response = self.client.get(
+                reverse('refresh_provider', kwargs={'pk': self.profile.pk, 'sns': sns})
+            )
+            self.assertEqual(response.status_code, 404)
+        mock_enqueue.assert_not_called()
+
+    def test_card_marked_refreshing(self):
+        url = reverse('activity_card', kwargs={'pk': self.profile.pk, 'sns': 'twitter'})
+        self.assertNotIn('Refreshing.', self.client.get(url).json()['html'])
+
+        cache.set(queued_key(self.profile.pk, 'twitter'), 1)
+
+        self.assertIn('Refreshing.', self.client.get(url).json()['html'])
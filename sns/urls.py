@@ -7,10 +7,18 @@ urlpatterns = [
     path('autocomplete/', views.profile_autocomplete, name='profile_autocomplete'),
     path('profiles/', views.ProfileList.as_view(), name='profile-list'),
     path('profile/<int:pk>/', views.Activity.as_view(), name='activity'),
+    path('profile/<int:pk>/card/<str:sns>/', views.activity_card, name='activity_card'),
     path('profile/<int:pk>/refresh/', views.refresh_activity, name='refresh_activity'),
+    path(
+        'profile/<int:pk>/refresh/<str:sns>/',
+        views.refresh_provider,
+        name='refresh_provider',
+    ),
     path('profile/<int:pk>/edit/', views.profile_edit, name='profile_edit'),
     path('profile/<int:pk>/del/', views.profile_delete, name='profile_delete'),
     path('profile/new/', views.profile_new, name='profile_new'),
+    path('ops/cache/', views.cache_stats, name='cache_stats'),
+    path('ops/breakers/', views.breaker_stats, name='breaker_stats'),
     path('meetup/<int:pk>/dance/', views.meetup_dance, name='meetup_dance'),
     path('meetup/callback/', views.meetup_callback, name='meetup_callback'),
 ]
@@ -1,14 +1,16 @@
-from django.conf import settings
 from django.contrib import messages
-from django.core.cache import cache
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.views.decorators.cache import cache_page
 from django.views.generic import DetailView, ListView
 
+from . import metrics
+from .activity import get_activity, record_view
 from .api.meetup import OAuth2Code as MeetupOAuth
-from .api.utils import GetActivity
+from .api.utils import CircuitBreaker
 from .forms import ProfileForm
+from .jobs import enqueue_refresh, refreshing
 from .models import Profile
 
 import json
@@ -16,8 +18,6 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-API_CACHE_TTL = settings.API_CACHE_TTL
-
 
 class ProfileList(ListView):
     model = Profile
@@ -26,6 +26,8 @@ class ProfileList(ListView):
 
 
 class Activity(DetailView):
+    """Page shell of a profile; its cards are loaded from `activity_card`"""
+
     model = Profile
     context_object_name = 'profile'
     template_name = 'sns/activity.html'
@@ -42,28 +44,50 @@ class Activity(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        context['data'] = {}
-        profile_cache = cache.get_many(cache.keys(':'.join([str(context['profile'].pk), '*'])))
-        for sns, acct in context['profile'].get_fields():
-            if acct:
-                key = ':'.join([str(context['profile'].pk), sns, acct])
-                # Use cache if available
-                if key in profile_cache:
-                    context['data'][sns] = profile_cache[key]
-                else:
-                    self.request, context['data'][sns] = getattr(GetActivity, sns)(
-                        self.request, acct
-                    )
-                    cache.set(key, context['data'][sns], API_CACHE_TTL)
+        # Popular profiles are refreshed ahead of time by `refresh_scheduler`
+        record_view(context['profile'].pk)
         return context
 
 
+def activity_card(request, pk, sns):
+    """Return one provider card of a profile's activity as JSON"""
+    profile = get_object_or_404(Profile, pk=pk)
+    acct = dict(profile.get_fields()).get(sns)
+    if not acct:
+        raise Http404
+    request, data, loading = get_activity(request, profile, only=sns)
+    context = {
+        'profile': profile,
+        'sns': sns,
+        'acct': acct,
+        'sns_data': data.get(sns),
+        'loading': loading,
+        'refreshing': refreshing(profile),
+    }
+    return JsonResponse(
+        {
+            'sns': sns,
+            'loading': bool(loading),
+            'html': render_to_string('sns/card.html', context, request),
+        }
+    )
+
+
 def refresh_activity(request, pk):
-    """Clear cache and reload activity view"""
+    """Queue a refresh and reload activity view with current data"""
+    if request.method == 'GET':
+        profile = get_object_or_404(Profile, pk=pk)
+        enqueue_refresh(profile, request.session)
+        return redirect('activity', pk=profile.pk)
+
+
+def refresh_provider(request, pk, sns):
+    """Queue a refresh of one provider card and reload activity view"""
     if request.method == 'GET':
         profile = get_object_or_404(Profile, pk=pk)
-        cache.delete_many(cache.keys(':'.join([str(profile.pk), '*'])))
+        if not dict(profile.get_fields()).get(sns):
+            raise Http404
+        enqueue_refresh(profile, request.session, sns)
         return redirect('activity', pk=profile.pk)
 
 
@@ -132,6 +156,28 @@ def profile_autocomplete(request):
     return HttpResponse(data, mimetype)
 
 
+def cache_stats(request):
+    """Return hits, misses and hit rate of each activity cache tier as JSON"""
+    data = {}
+    for tier in ('local', 'shared'):
+        hits, misses = metrics.get(
+            'activity:%s_hits' % tier, 'activity:%s_misses' % tier
+        ).values()
+        data[tier] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else None,
+        }
+    return JsonResponse(data)
+
+
+def breaker_stats(request):
+    """Return circuit breaker state of each provider as JSON"""
+    return JsonResponse(
+        {sns: CircuitBreaker.state(sns) for sns, _ in Profile().get_fields()}
+    )
+
+
 def meetup_dance(request, pk):
     """Request oauth authentication code"""
     if request.method == 'GET':
@@ -151,4 +197,6 @@ def meetup_callback(request):
         del request.session['meetup_pk']
         auth = MeetupOAuth()
         request.session['meetup_token'] = auth.get_access(request.build_absolute_uri())
+        # Token may belong to a different member now
+        request.session.pop('meetup_member_id', None)
         return redirect('activity', pk=pk)